@@ -38,8 +38,17 @@ except ImportError:
 
 orig	= sys.excepthook
 stderr	= sys.stderr
+
+# Hooks like the one of pytino.log.ring() offer a .pre()
+# to run before we enter the debugger
+def hook(etype, value, tb):
+	pre	= getattr(orig, 'pre', None)
+	if pre:
+		pre(etype, value, tb)
+	debug(etype, value, tb)
+
 if stderr.isatty():
-	sys.excepthook	= debug
+	sys.excepthook	= hook
 
 def runscript(argv, script_file=None, name='__main__', local=None):
 	"""
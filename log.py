@@ -23,7 +23,7 @@
 # log.setup('name', log.ERROR)	# default is log.INFO
 # log.warn('hello', 'world')	# not shown for log.ERROR
 #
-# log.twisted()			# if you use twisted
+# log.twisted()			# if you use twisted (makes logging using async)
 # log.asyncio()			# if you use asyncio (makes logging using async)
 #
 # In modules:
@@ -46,9 +46,24 @@ from __future__ import absolute_import as _absolute_import
 from __future__ import print_function as _print_function
 
 import os as _os
+import re as _re
 import sys as _sys
 import time as _time
+import struct as _struct
+import atexit as _atexit
 import logging as _logging
+import threading as _threading
+import itertools as _itertools
+import collections as _collections
+
+if __package__:
+	from . import time as _stamp	# pytino.time, not time
+else:
+	# not imported as pytino.log, for example run as script
+	import importlib.util as _util
+	_spec	= _util.spec_from_file_location('_pytino_time', _os.path.join(_os.path.dirname(_os.path.abspath(__file__)), 'time.py'))
+	_stamp	= _util.module_from_spec(_spec)
+	_spec.loader.exec_module(_stamp)
 
 
 # This is a log wrapper
@@ -62,10 +77,23 @@ _SANEFORMAT	= '%(asctime)s %(levelname)s %(name)s %(module)s:%(lineno)s %(funcNa
 _FULLFORMAT	= '%(asctime)s %(levelname)s %(name)s %(pathname)s:%(lineno)s %(funcName)s %(message)s'
 _SANEDATE	= '%Y%m%d-%H%M%S'
 
+# Overflow policies of background(), see there
+BLOCK	= 'block'
+OLDEST	= 'oldest'
+NEWEST	= 'newest'
+
 # Set some global runtime variables
 __DEBUGGING__	= __name__ == '__main__'
 _disabled	= False
 _level		= None
+_root		= _logging.getLogger()
+_format		= _SANEFORMAT
+_subsec		= 0
+_escaping	= False
+_o_log_		= getattr(_logging.Logger._log, '__wrapped__', _logging.Logger._log)
+_background	= None
+_collector	= None
+_wrappers	= ()	# ( function, level, code ), see _rebind()
 
 
 # missing environment test
@@ -76,9 +104,21 @@ def __setup__():	# Do not pollute globals()
 	If you want something else, you can call logging.basicConfig() before.
 	Environment:
 		PYTHON_LOG_LEVEL:	either a number (level) or 'DEBUG', 'INFO', etc.
-		PYTHON_LOG_FILE:	an additional file to log to.
+		PYTHON_LOG_FILE:	an additional file to log to, see logfile() for
+		PYTHON_LOG_FILE_*:	SIZE, ROTATE, KEEP, COMPRESS, BUFFER, FLUSH, SYNC, BINARY
 		PYTHON_LOG_FORMAT:	set your own logging format
 		PYTHON_LOG_DEBUG:	use full name to filenames in log and further debugging
+		PYTHON_LOG_SUBSEC:	number of sub-second digits for timestamps
+		PYTHON_LOG_QUEUE:	queue size for background(), asyncio() and twisted()
+		PYTHON_LOG_POLICY:	overflow policy for background(): block, oldest or newest
+					(asyncio() and twisted() default to oldest)
+		PYTHON_LOG_ESCAPE:	write parseable lines, see escape()
+		PYTHON_LOG_COLLECT:	send all output to the collector, see collect()
+		PYTHON_LOG_RATE:	limit records per call site, see limit()
+		PYTHON_LOG_REPEAT:	suppress repeated messages, see limit()
+		PYTHON_LOG_RING:	keep the last N records in memory, see ring()
+		PYTHON_LOG_RING_SIGNAL:	dump them on this signal, like USR1
+		PYTHON_LOG_METRICS:	count records, see metrics()
 	There is a special level 'NONE', which disables logger via this module.
 	'''
 	# ensure this is called only once
@@ -109,23 +149,23 @@ def __setup__():	# Do not pollute globals()
 	# Eliminate stackframes from (this and possibly other) wrapper modules
 	_logging.__LOGWRAPPER__	= _logging
 	_logging.currentframe	= _removeWrapperFrames(_logging.currentframe)
-	_logging.Logger._log	= _ignoreNoLoggingException(_logging.Logger._log)
+	_logging.Logger._log	= _levelFilter(_logging.Logger._log)
+	_logging.Logger.setLevel	= _levelWatch(_logging.Logger.setLevel)
 
 	if _os.getenv('PYTHON_LOG_DEBUG'):
 		__module__.__DEBUGGING__	= True
 
-	_logging.basicConfig(datefmt=_SANEDATE, format=_os.getenv('PYTHON_LOG_FORMAT') or __module__.__DEBUGGING__ and _FULLFORMAT or _SANEFORMAT)
+	__module__._format	= _os.getenv('PYTHON_LOG_FORMAT') or __module__.__DEBUGGING__ and _FULLFORMAT or _SANEFORMAT
+	__module__._subsec	= int(_os.getenv('PYTHON_LOG_SUBSEC') or 0)
+	had	= list(_root.handlers)
+	_logging.basicConfig(datefmt=_SANEDATE, format=_format)
+	for h in _root.handlers:
+		if h not in had:
+			h.setFormatter(_formatter())
 
 	# Why isn't there an ENV var which let us overwrite the level?
 	# Why has this to be done by yourself, parsing options or even more crappy?
-	lvl	= None
-	env	= _os.getenv('PYTHON_LOG_LEVEL')
-	if env:
-		try:	lvl = int(env)
-		except:	lvl = getattr(__module__, env, None)
-	if not isinstance(lvl, int):
-		lvl	= INFO
-	level(lvl)
+	level(_envlevel('PYTHON_LOG_LEVEL', INFO))
 
 	# BUG: Timezone is missing in timestamps by default (the ISO8601 isn't ISO8601 compliant)
 	# Logging shall always be done in UTC, to be able to compare server times
@@ -138,7 +178,29 @@ def __setup__():	# Do not pollute globals()
 
 	env = _os.getenv('PYTHON_LOG_FILE')
 	if env:
-		_logging.getLogger().addHandler(_logging.FileHandler(env,'a'))
+		logfile(env)
+
+	if _os.getenv('PYTHON_LOG_ESCAPE'):
+		escape(True)
+
+	if hasattr(_os, 'register_at_fork'):
+		_os.register_at_fork(before=_prefork, after_in_child=_forked)
+
+	env = _os.getenv('PYTHON_LOG_COLLECT')
+	if env:
+		_ship(env)
+
+	env = _os.getenv('PYTHON_LOG_RATE')
+	if env or _os.getenv('PYTHON_LOG_REPEAT'):
+		env	= (env or '0').split('/')
+		limit(int(env[0]), len(env) > 1 and float(env[1]) or 1, bool(_os.getenv('PYTHON_LOG_REPEAT')))
+
+	if _os.getenv('PYTHON_LOG_METRICS'):
+		metrics(True)
+
+	env = _os.getenv('PYTHON_LOG_RING')
+	if env:
+		ring(int(env), _os.getenv('PYTHON_LOG_RING_SIGNAL'))
 
 	# inject everything into everything
 	# such that even if you get some .info as logging routine,
@@ -151,13 +213,37 @@ def __setup__():	# Do not pollute globals()
 				setattr(o, k, v)
 
 
+def _envlevel(name, default):
+	lvl	= None
+	env	= _os.getenv(name)
+	if env:
+		try:	lvl = int(env)
+		except:	lvl = getattr(__module__, env, None)
+	if not isinstance(lvl, int):
+		lvl	= default
+	return lvl
+
+
+def _envunit(name, default, units):
+	'''
+	Number from environment with optional unit like 10M or 1d
+	'''
+	env	= _os.getenv(name)
+	if not env:
+		return default
+	return int(float(env[:-1]) * units[env[-1]]) if env[-1] in units else int(env)
+
+_BYTES	= { 'k':1<<10, 'K':1<<10, 'M':1<<20, 'G':1<<30 }
+_SECS	= { 's':1, 'm':60, 'h':3600, 'd':86400 }
+
+
 # barely tested
 def level(level=None):
 	'''
 	Get or set the logging level to something else.
 	If set to 0 (NONE), logging is entirely disabled.
 	If it is lower than a module's __LOGLEVEL__,
-	the latter wins on the module scale.
+	the latter wins on the module scale, see modlevel().
 	'''
 	if level == NONE or level == 'NONE':
 		__module__._disabled	= True
@@ -166,8 +252,9 @@ def level(level=None):
 		__module__._disabled	= False
 	if level:
 		# Are we really in Java here?  Pretty looks like it: WTF!
-		_logging.getLogger().setLevel(level)
-		__module__._level	= level
+		_root.setLevel(level)
+		__module__._level	= _root.level
+		_rebind()
 
 	return not __module__._disabled and __module__._level or NONE
 
@@ -218,11 +305,8 @@ def setup(name=None, level=None):
 	return __module__
 
 
-# Only used internally, to allow to hack a module's __LOGLEVEL__
-class _NoLoggingException(Exception):	pass
-
 # Not tested with kw yet
-def xlog(__LOGLEVEL__, s, *args, **kw):
+def xlog(level, s, *args, **kw):
 	'''
 	Use this, if you cannot use log() use xlog() instead of logging.log()!
 	It is a wrapper around logging.log() with the same arguments:
@@ -234,21 +318,16 @@ def xlog(__LOGLEVEL__, s, *args, **kw):
 		https://docs.python.org/3/library/logging.html#logging.log
 	'''
 	if __module__._disabled: return
+	if _ring: _keep(level, s, args)
+	f	= _caller(level)
+	if f is None or _limits and _limited(f, level, (s, args), kw): return
 
-#	print(__LOGLEVEL__, s, args, kw)
+#	print(level, s, args, kw)
 
-	# module.__LOGLEVEL__ support hacked in here.
-	# This probably only works with modules,
-	# which use pytino.log, of course.
-	try:
-		_logging.log(__LOGLEVEL__, str(s).rstrip(' \t\n\r'), *args, **kw)
-#		if __module__.__DEBUGGING__: print('oh, baby, try')
-	except _NoLoggingException:
-#		if __module__.__DEBUGGING__: print('eye to eye')
-		pass
+	# Already checked and we know the caller, so directly create the record
+	_emit(f, level, str(s).rstrip(' \t\n\r'), args, **kw)
 
 
-# XXX TODO XXX tested, but incomplete (missing escapes)
 def log(level, *args, **kw):
 	'''
 	Do some logging without thinking about anything.
@@ -256,23 +335,554 @@ def log(level, *args, **kw):
 	No hidden pitfalls or similar.
 	'''
 	if __module__._disabled: return
-	j = []
-	for v in args:
-		try:
-			j.append(str(v))
-		except Exception as e:
-			j.append('(exception '+str(e)+')')
-	for k,v in kw.items():
+	a	= None
+	if _ring:
+		a	= _Args(args, kw)	# rendered once for the ring and the output
+		_keep(level, a, ())
+	f	= _caller(level)
+	if f is None or _limits and _limited(f, level, args, kw): return
+	_emit(f, level, a or _Args(args, kw), ())
+
+
+def _caller(level, logger=_root):
+	'''
+	Check early if a message is suppressed,
+	either by the logger (the root for log() and xlog())
+	or the level table (see modlevel()).
+	This is done before anything is rendered or logging is entered.
+	Returns None if suppressed, else the frame of the caller.
+	'''
+	if not logger.isEnabledFor(level):
+		if _counts is not None:
+			_count(_skip(_sys._getframe(2))[1].name, level, 1)
+		return None
+	f	= _sys._getframe(1)
+	while True:
+		m, t, _	= _codes.get(id(f.f_code)) or _code(f)
+		g	= m.g
+		if g.get('__LOGLEVEL__') is not m.lvl or g.get('__LOGWRAPPER__') is not m.wrap:
+			m.refresh()
+		if not m.wrapper:
+			if level < (m.level if t is None else t):
+				if _counts is not None:
+					_count(m.name, level, 2)
+				return None
+			return f
+		if f.f_back is None:
+			return f
+		f	= f.f_back
+
+
+def _emit(f, level, msg, args, exc_info=None, extra=None, **kw):
+	'''
+	Like Logger._log(), but the caller is frame f,
+	so there is no need to search it with findCaller().
+	Everything else (stack_info etc.) is left to Logger._log().
+	'''
+	code	= f.f_code
+	name	= None
+	if _counts is not None:
+		name	= (_codes.get(id(code)) or _code(f))[0].name
+		_count(name, level, 0)
+	if kw:
+		return _o_log_(_root, level, msg, args, exc_info=exc_info, extra=extra, **kw)
+	if exc_info:
+		if isinstance(exc_info, BaseException):
+			exc_info	= (type(exc_info), exc_info, exc_info.__traceback__)
+		elif not isinstance(exc_info, tuple):
+			exc_info	= _sys.exc_info()
+	r	= _root.makeRecord(_root.name, level, code.co_filename, f.f_lineno, msg, args, exc_info, code.co_name, extra)
+	if name:
+		r.pytino_mod	= name	# see _counted()
+	_root.handle(r)
+
+
+# Metrics, see metrics()
+_counts		= None	# threading.local() while counting
+_countsall	= []	# [ thread, { ( name, level ): [ emitted, level, module, dropped, bytes ] } ]
+_Counts		= _collections.namedtuple('Counts', 'emitted level module dropped bytes')
+
+def metrics(on=None):
+	'''
+	Get or set counting of records per module and level:
+		emitted:	records output
+		level:		suppressed by the level
+		module:		suppressed by __LOGLEVEL__ or modlevel()
+		dropped:	dropped by limit() or background()
+		bytes:		bytes written, once per record (by the first handler)
+	The module is the __name__ of the caller of log() and xlog(),
+	for other records it is the logger name.
+	Each thread counts on its own, see counters() for the sum.
+	Note that counting needs the caller, even of suppressed records,
+	so suppressed calls are more expensive then (see level()).
+	'''
+	if on is not None:
+		__module__._counts	= _threading.local() if on else None
+		_rebind()
+	return _counts is not None
+
+
+def _count(name, level, what, n=1):
+	t	= _counts
+	if t is None:
+		return
+	try:
+		h	= t.h
+	except AttributeError:
+		h	= t.h = [_threading.current_thread(), {}]
+		_countsall.append(h)
+	d	= h[1]
+	c	= d.get((name, level))
+	if c is None:
+		c	= d[(name, level)] = [0, 0, 0, 0, 0]
+	c[what]	+= n
+
+
+def _counted(record, s):
+	# formatted for some handler, like stderr: a line of UTF-8
+	if _counts is not None and 'pytino_bytes' not in record.__dict__:
+		_written(record, (len(s) if s.isascii() else len(s.encode('utf-8', 'backslashreplace'))) + 1)
+	return s
+
+
+def _written(record, n):
+	# bytes of the record, counted once even if several handlers write it
+	if _counts is not None and 'pytino_bytes' not in record.__dict__:
+		record.pytino_bytes	= n
+		_count(getattr(record, 'pytino_mod', record.name), record.levelno, 4, n)
+
+
+def counters(reset=False):
+	'''
+	Snapshot of metrics() summed over all threads:
+	{ ( name, level ): Counts(emitted, level, module, dropped, bytes) }
+	With reset=True the counters start again from 0.
+	Concurrent counts might get lost by this.
+	'''
+	tot	= {}
+	for h in list(_countsall):
+		d	= h[1]
+		if reset:
+			h[1]	= {}
+		for k, c in list(d.items()):
+			o	= tot.get(k)
+			tot[k]	= c if o is None else [a + b for a, b in zip(o, c)]
+	if reset:
+		_countsall[:]	= [h for h in _countsall if h[0].is_alive()]
+	return dict((k, _Counts(*c)) for k, c in tot.items())
+
+
+# Limits per call site, see limit()
+_limits		= None	# ( rate, per, repeat )
+_sites		= {}	# ( id(code), instruction ) -> _Site
+
+def limit(rate=None, per=None, repeat=None):
+	'''
+	Limit the records of log() and xlog() per call site:
+	rate:	at most this many records per call site within per seconds
+	per:	the period in seconds, default 1
+	repeat:	suppress identical messages repeated by the same call site
+	Suppressed records are counted and reported at the call site
+	when its next period starts (or at the latest after per seconds)
+	as "suppressed N records" or "last message repeated N times".
+	limit(0, repeat=False) switches this off again.
+	Environment: PYTHON_LOG_RATE=rate[/per] and PYTHON_LOG_REPEAT
+	Returns ( rate, per, repeat )
+	'''
+	old	= _limits or (0, 1, False)
+	if rate is None and per is None and repeat is None:
+		return old
+	lim	= ( old[0] if rate is None else rate, old[1] if per is None else per, old[2] if repeat is None else bool(repeat) )
+	if not _limits:
+		_atexit.register(_unlimit, True)
+	if not _limits or lim[1] != old[1]:
+		_unevery(_unlimit)
+		_every(lim[1], _unlimit)
+	__module__._limits	= (lim[0] or lim[2]) and lim or None
+	_sites.clear()
+	return lim
+
+
+class _Site(object):
+	'''
+	State of a call site, see limit()
+	'''
+	__slots__	= ('until', 'count', 'dropped', 'repeated', 'args', 'kw', 'level', 'path', 'line', 'func', 'mod')
+
+	def __init__(self, f, level):
+		self.until	= 0
+		self.count	= 0
+		self.dropped	= 0
+		self.repeated	= 0
+		self.args	= None
+		self.kw		= None
+		self.level	= level
+		self.path	= f.f_code.co_filename
+		self.line	= f.f_lineno
+		self.func	= f.f_code.co_name
+		self.mod	= (_codes.get(id(f.f_code)) or _code(f))[0].name
+
+	def report(self):
+		n, self.dropped		= self.dropped, 0
+		r, self.repeated	= self.repeated, 0
+		if r:
+			self.emit('last message repeated %d times', r)
+		if n:
+			self.emit('suppressed %d records', n)
+
+	def emit(self, msg, n):
+		r	= _root.makeRecord(_root.name, self.level, self.path, self.line, msg, (n,), None, self.func)
+		r.pytino_mod	= self.mod	# see _counted()
+		_root.handle(r)
+
+
+def _limited(f, level, args, kw):
+	'''
+	Check the limits of the call site of frame f, see limit()
+	'''
+	rate, per, repeat	= _limits
+	key	= (id(f.f_code), f.f_lasti)
+	s	= _sites.get(key)
+	if s is None:
+		s	= _sites[key] = _Site(f, level)
+	now	= _time.time()
+	if now >= s.until:
+		if s.dropped or s.repeated:
+			s.report()
+		s.until	= now + per
+		s.count	= 0
+	if repeat:
 		try:
-			j.append(str(k)+'='+str(v))
-		except Exception as e:
-			j.append('(exception '+str(e)+')')
-	# XXX TODO XXX
-	# Here be Dragons:
-	# We need some standard escaping here
-	# to allow easy parsing with 3rd party tools
-	# in future
-	xlog(level, "%s", ' '.join(j).rstrip(' \t\n\r'))
+			same	= s.args == args and s.kw == kw
+		except Exception:
+			same	= False
+		if same:
+			s.repeated	+= 1
+			if _counts is not None:
+				_count((_codes.get(id(f.f_code)) or _code(f))[0].name, level, 3)
+			return True
+		if s.repeated:
+			s.report()
+		s.args	= args
+		s.kw	= kw
+	s.level	= level
+	s.count	+= 1
+	if rate and s.count > rate:
+		s.dropped	+= 1
+		if _counts is not None:
+			_count((_codes.get(id(f.f_code)) or _code(f))[0].name, level, 3)
+		return True
+	return False
+
+
+def _unlimit(force=False):
+	# Report what was suppressed by sites which went silent
+	now	= _time.time()
+	for s in list(_sites.values()):
+		if (s.dropped or s.repeated) and (force or now >= s.until):
+			s.report()
+
+
+# Ring of recent records, see ring()
+_ring		= None	# preallocated slots: ( time, level, code, line, text )
+_ringc		= None	# itertools.count() of the next slot
+
+def ring(size=None, sig=None):
+	'''
+	Keep the last size records of log() and xlog() in memory,
+	regardless of their level, such that they can be dumped
+	when something goes wrong.  The message is rendered to text
+	on each call, such that the dump shows the state at that time.
+	So with ring() even suppressed calls pay for rendering.
+	The ring is dumped by fatal(), on uncaught exceptions
+	(see also pytino.debug) and on signal sig (like 'USR1'), if given.
+	ring(0) switches this off again.
+	Environment: PYTHON_LOG_RING and PYTHON_LOG_RING_SIGNAL
+	Returns the size
+	'''
+	if size is None:
+		return len(_ring) if _ring else 0
+	__module__._ringc	= _itertools.count()
+	__module__._ring	= [None] * size if size > 0 else None
+	_rebind()
+	if _ring and _sys.excepthook is not _excepthook:
+		_excepthook.orig	= _sys.excepthook
+		_sys.excepthook		= _excepthook
+		if hasattr(_threading, 'excepthook') and _threading.excepthook is not _threxcepthook:
+			_threxcepthook.orig	= _threading.excepthook
+			_threading.excepthook	= _threxcepthook
+	if sig:
+		import signal as _signal
+		if not isinstance(sig, int):
+			sig	= int(sig) if sig.isdigit() else getattr(_signal, sig.upper() if sig.upper().startswith('SIG') else 'SIG'+sig.upper())
+		old	= _signal.signal(sig, _onsignal)
+		if old is not _onsignal:	# else we would call ourself
+			_sigorig[sig]	= old
+	return size
+
+
+def _skip(f):
+	'''
+	Find the caller like _caller() does, but regardless of levels.
+	Returns ( frame, _Mod )
+	'''
+	while True:
+		m	= (_codes.get(id(f.f_code)) or _code(f))[0]
+		if m.stale():
+			m.refresh()
+		if not m.wrapper or f.f_back is None:
+			return f, m
+		f	= f.f_back
+
+
+def _keep(level, msg, args):
+	f	= _skip(_sys._getframe(2))[0]
+	r	= _ring
+	if r:
+		if args:
+			try:
+				msg	= str(msg) % args
+			except Exception:
+				msg	= '%s %% %r' % (msg, args)
+		r[next(_ringc) % len(r)]	= (_time.time(), level, f.f_code, f.f_lineno, str(msg))
+
+
+def dump(why=None):
+	'''
+	Output and clear the records kept by ring().
+	They are output with their original level and time,
+	enclosed by two records telling why.
+	'''
+	old	= _ring
+	if not old:
+		return
+	__module__._ring	= [None] * len(old)
+	kept	= sorted((r for r in old if r), key=lambda r: r[0])
+	emit	= lambda lvl, msg, args, path=__file__, line=0, func='dump': _root.handle(_root.makeRecord(_root.name, lvl, path, line, msg, args, None, func))
+	emit(WARNING, 'ring dump (%s): %d records', (why or 'requested', len(kept)))
+	for t, lvl, code, line, msg in kept:
+		r	= _root.makeRecord(_root.name, lvl, code.co_filename, line, msg, (), None, code.co_name)
+		r.created	= t
+		r.msecs		= (t - int(t)) * 1000
+		r.relativeCreated = (t - _logging._startTime) * 1000
+		_root.handle(r)
+	emit(WARNING, 'ring dump end', ())
+	flush()
+
+
+def _dumpexc(etype, value, tb):
+	if _ring:
+		dump('uncaught '+etype.__name__)
+
+def _excepthook(etype, value, tb):
+	_dumpexc(etype, value, tb)
+	_excepthook.orig(etype, value, tb)
+_excepthook.pre	= _dumpexc	# see pytino.debug
+_excepthook.orig	= _sys.excepthook
+
+def _threxcepthook(args):
+	_dumpexc(args.exc_type, args.exc_value, args.exc_traceback)
+	_threxcepthook.orig(args)
+
+_sigorig	= {}	# signal -> previous handler, see ring()
+
+def _onsignal(sig, frame):
+	# Do not log from the signal handler, the interrupted code might hold locks
+	t	= _threading.Thread(target=dump, args=('signal %d' % sig,), name=__name__)
+	t.daemon = True
+	t.start()
+	orig	= _sigorig.get(sig)
+	if callable(orig):
+		orig(sig, frame)
+
+
+class _Args(object):
+	'''
+	The arguments to log(), rendered when the record is output.
+	With escape() each argument is escaped, see there.
+	'''
+	__slots__	= ('args', 'kw', 's')
+
+	def __init__(self, args, kw):
+		self.args	= args
+		self.kw		= kw
+		self.s		= None
+
+	def __str__(self):
+		if self.s is None:
+			esc	= _escaping
+			j	= []
+			for v in self.args:
+				try:
+					v	= str(v)
+				except Exception as e:
+					v	= '(exception '+str(e)+')'
+				j.append(esc and _esc(v) or v)
+			for k,v in self.kw.items():
+				try:
+					k	= str(k)
+					v	= str(v)
+				except Exception as e:
+					j.append(esc and _esc('(exception '+str(e)+')') or '(exception '+str(e)+')')
+					continue
+				j.append(esc and _esc(k)+'='+_escval(v) or k+'='+v)
+			self.s	= ' '.join(j).rstrip(' \t\n\r')
+		return self.s
+
+
+# Escaping, see escape()
+_ESCVAL		= dict((i, '\\x%02x' % i) for i in range(32))
+_ESCVAL.update({ 0x7f:'\\x7f', ord('\\'):'\\\\', ord(' '):'\\s', ord('\t'):'\\t', ord('\n'):'\\n', ord('\r'):'\\r' })
+_ESCAPES	= dict(_ESCVAL)
+_ESCAPES[ord('=')]	= '\\x3d'
+_NEEDESC	= _re.compile(r'[\x00-\x20\\=\x7f]').search
+_NEEDVAL	= _re.compile(r'[\x00-\x20\\\x7f]').search
+_UNESC		= _re.compile(r'\\(x[0-9a-fA-F]{2}|.)').sub
+_UNESCAPES	= { '\\':'\\', 's':' ', 't':'\t', 'n':'\n', 'r':'\r', '-':'' }
+
+def _esc(s):
+	if not s:
+		return '\\-'
+	return s.translate(_ESCAPES) if _NEEDESC(s) else s
+
+def _escval(s):
+	return s.translate(_ESCVAL) if _NEEDVAL(s) else s
+
+def _unesc1(m):
+	c	= m.group(1)
+	if len(c) == 3:
+		return chr(int(c[1:], 16))
+	return _UNESCAPES.get(c, c)
+
+def _unesc(s):
+	return _UNESC(_unesc1, s) if '\\' in s else s
+
+
+class _Escaped(object):
+	'''
+	Record as seen by the format of _Formatter: all strings escaped.
+	'''
+	__slots__	= ('r',)
+
+	def __init__(self, r):
+		self.r	= r
+
+	def __getitem__(self, k):
+		v	= self.r.__dict__[k]
+		if k == 'message' and isinstance(self.r.msg, _Args):
+			return v
+		return isinstance(v, str) and _esc(v) or v
+
+
+class _SaneFormatter(_logging.Formatter):
+	'''
+	Formatter which renders _SANEDATE via the cache of pytino.time
+	'''
+	def formatTime(self, record, datefmt=None):
+		if datefmt == _SANEDATE:
+			return _stamp.UTCstamp(record.created, _subsec)
+		return _logging.Formatter.formatTime(self, record, datefmt)
+
+	def format(self, record):
+		return _counted(record, _logging.Formatter.format(self, record))
+
+
+class _Formatter(_SaneFormatter):
+	'''
+	Formatter for escape():
+	all fields are escaped, such that each field is one word.
+	Exceptions and stack are added as exc= and stack= keywords.
+	'''
+	def formatMessage(self, record):
+		if not isinstance(self._style, _logging.PercentStyle):
+			return _logging.Formatter.formatMessage(self, record)
+		return self._style._fmt % _Escaped(record)
+
+	def format(self, record):
+		record.message = record.getMessage()
+		if self.usesTime():
+			record.asctime = self.formatTime(record, self.datefmt)
+		s = self.formatMessage(record)
+		if record.exc_info and not record.exc_text:
+			record.exc_text = self.formatException(record.exc_info)
+		if record.exc_text:
+			s += ' exc=' + _escval(record.exc_text)
+		if record.stack_info:
+			s += ' stack=' + _escval(self.formatStack(record.stack_info))
+		return _counted(record, s)
+
+
+def escape(on=None):
+	'''
+	Get or set escaping of log lines:
+	Each field, each argument and each key=value of log() is one word.
+	Within these, backslash, blank and control characters are escaped
+	as \\\\, \\s, \\t, \\n, \\r and \\xHH, empty words are \\-
+	and = is escaped as \\x3d except in values of keywords.
+	A message of xlog() is a single word.
+	Exceptions and stack come last as exc= and stack= keywords.
+	Use parse() to read it back.
+	'''
+	if on is not None:
+		__module__._escaping	= bool(on)
+		for h in _handlers():
+			f	= h.formatter
+			fmt	= f and f._fmt or _format
+			date	= f and f.datefmt or _SANEDATE
+			h.setFormatter(_formatter(fmt, date))
+	return _escaping
+
+
+def _formatter(fmt=None, date=_SANEDATE):
+	return (_escaping and _Formatter or _SaneFormatter)(fmt or _format, date)
+
+
+def _handlers():
+	'''
+	The handlers which do the output
+	'''
+	q	= __module__._background
+	return list(q and q.handlers or _root.handlers)
+
+
+_Parsed	= _collections.namedtuple('Record', 'time level name file line func args kw')
+
+def parse(f):
+	'''
+	Read back the log lines of file, pipe or list of lines f.
+	This is a generator, which returns tuples (named like):
+		(time, level, name, file, line, func, args, kw)
+	Without escape() this is only some approximation,
+	in that case lines which do not start with a timestamp
+	(like tracebacks) are added to the previous record as kw['exc'].
+	'''
+	last	= None
+	for line in f:
+		if isinstance(line, bytes):
+			line	= line.decode('utf-8', 'replace')
+		t	= line.rstrip('\r\n').split(' ')
+		if len(t) < 5 or t[0][8:9] != '-' or not t[0][:8].isdigit():
+			if last is not None:
+				e	= last.kw.get('exc')
+				line	= line.rstrip('\r\n')
+				last.kw['exc']	= line if e is None else e+'\n'+line
+			continue
+		if last is not None:
+			yield last
+		fn, _, l	= t[3].rpartition(':')
+		args	= []
+		kw	= {}
+		for a in t[5:]:
+			if not a:
+				continue
+			i	= a.find('=')
+			if i < 0:
+				args.append(_unesc(a))
+			else:
+				kw[_unesc(a[:i])]	= _unesc(a[i+1:])
+		last	= _Parsed(t[0], _unesc(t[1]), _unesc(t[2]), _unesc(fn), int(l) if l.isdigit() else l, _unesc(t[4]), args, kw)
+	if last is not None:
+		yield last
 
 
 # This could be improved by re-implementing logging.Logger.findCaller()
@@ -283,30 +893,21 @@ def _removeWrapperFrames(currentframe, same=True):
 	ignore the stack for modules, which have a property
 		__LOGWRAPPER__ = logging
 	This is totally safe, because who else would do this?
-
-	Also in modules using this logger, you can set
-		__LOGLEVEL__ = N
-	to skip all output below this minimal global level,
-	such that full debugging needs to be enabled on the module level with
-		modulename.__LOGLEVEL__ = 0
-	for the case this is needed.
-	(However this comes with a performance penalty at low debug levels.)
+	This property is cached, see _Mod.
 	"""
 
 	def wrap(*args, **kw):
 		c	= currentframe(*args, **kw)
 		p	= c
 		f	= c
-		l	= 0
 		while not f is None:
-			if not f.f_globals.get('__LOGWRAPPER__', None) is _logging:
-				if f.f_globals.get('__LOGLEVEL__', 0) > l > 0:
-#					if __module__.__DEBUGGING__: print('hush hush')
-					raise _NoLoggingException()
+			m	= (_codes.get(id(f.f_code)) or _code(f))[0]
+			if m.stale():
+				m.refresh()
+			if not m.wrapper:
 				if same:	c = f
 #				if __module__.__DEBUGGING__ and c.f_code: print('@DEBUG@log@', c.f_code.co_filename, file=_sys.stderr)
 				return c
-			l = f.f_locals.get('__LOGLEVEL__', l)
 			p = c
 			c = f
 			f = f.f_back
@@ -317,33 +918,139 @@ def _removeWrapperFrames(currentframe, same=True):
 
 
 # This can be used as a decorator
-def _ignoreNoLoggingException(_log):
+def _levelFilter(_log):
 	'''
-	Wrap a logging function such, that _NoLoggingException is ignored.
-	In that case the function just returns without doing anything.
+	Wrap Logger._log() such, that the level table (see modlevel())
+	is honored for all logging, not only for calls via this module.
 	'''
 	def wrap(c, l, s, *args, **kw):
-		try:
-			_log(c, l, str(s).rstrip(' \t\n\r'), *args, **kw)
-		except _NoLoggingException:
-			pass
+		if _caller(l, c) is None: return
+		_log(c, l, str(s).rstrip(' \t\n\r'), *args, **kw)
+	wrap.__wrapped__	= _log
 	return wrap
 
 
+def _levelWatch(setLevel):
+	'''
+	Wrap Logger.setLevel(), such that level() and the wrappers
+	(see _rebind()) follow logging.getLogger().setLevel(), too.
+	'''
+	def wrap(c, l):
+		setLevel(c, l)
+		if c is _root:
+			__module__._level	= _root.level
+			_rebind()
+	wrap.__wrapped__	= setLevel
+	return wrap
+
+
+# The level table:
+# Modules using this logger can set
+#	__LOGLEVEL__ = N
+# to skip all output below this minimal global level,
+# such that full debugging needs to be enabled on the module level with
+#	modulename.__LOGLEVEL__ = 0
+# for the case this is needed.  See also modlevel().
+#
+# The table is keyed by id(), as hashing code is expensive.
+# The values keep the objects alive, so the id() cannot be reused.
+_levels		= {}	# module name or (module name, function name) -> level
+_modules	= {}	# id(globals) -> _Mod
+_codes		= {}	# id(code) -> ( _Mod, level of the function or None, code )
+
+def _code(f):
+	'''
+	Put the code of frame f into the level table.
+	'''
+	g	= f.f_globals
+	m	= _modules.get(id(g))
+	if m is None:
+		m	= _Mod(g)
+		_modules[id(g)]	= m
+	co	= f.f_code
+	c	= ( m, _levels.get((m.name, getattr(co, 'co_qualname', co.co_name))), co )
+	_codes[id(co)]	= c
+	return c
+
+
+class _Mod(object):
+	'''
+	The level table entry of a module.
+	lvl and wrap are the values last seen in the globals,
+	if they are not the same object anymore, refresh() is needed.
+	'''
+	__slots__	= ('g', 'name', 'lvl', 'wrap', 'wrapper', 'level')
+
+	def __init__(self, g):
+		self.g		= g
+		self.name	= g.get('__name__')
+		self.lvl	= self.wrap = None
+		self.refresh(False)
+
+	def stale(self):
+		g	= self.g
+		return g.get('__LOGLEVEL__') is not self.lvl or g.get('__LOGWRAPPER__') is not self.wrap
+
+	def refresh(self, changed=True):
+		g		= self.g
+		lvl		= g.get('__LOGLEVEL__')
+		if changed and lvl is not self.lvl and self.name in _levels:
+			_levels[self.name]	= lvl or 0	# the module's own assignment wins over modlevel()
+		self.lvl	= lvl
+		self.wrap	= g.get('__LOGWRAPPER__')
+		self.wrapper	= self.wrap is _logging
+		self.level	= _levels.get(self.name, lvl or 0)
+
+
+def modlevel(module, level=None, fn=None):
+	'''
+	Get or set the __LOGLEVEL__ of a module (module or its name).
+	With fn=name this is for the given function of the module only,
+	which then overrides the module's level.
+	Setting this before the module is imported overrides
+	the module's own __LOGLEVEL__.  Returns the level.
+	'''
+	name	= getattr(module, '__name__', module)
+	key	= name if fn is None else (name, fn)
+	mod	= _sys.modules.get(name)
+	if level is None:
+		if key in _levels or fn is not None:
+			return _levels.get(key, 0)
+		return getattr(mod, '__LOGLEVEL__', 0)
+
+	_levels[key]	= level
+	if fn is None:
+		if mod is not None:
+			setattr(mod, '__LOGLEVEL__', level)
+		for m in _modules.values():
+			if m.name == name:
+				m.refresh()
+	else:
+		_codes.clear()	# rebuilt on demand
+	return level
+
+
 # Currently only tested with Python2
 def twisted(*args, **kw):
 	'''
 	Enable this module for twisted logging,
 	including patches to improve the output.
-	Please beware as twisted is not prepared for this,
-	because twisted assumes, logging is nonblocking,
+	Twisted assumes, logging is nonblocking,
 	but python standard logging might block,
 	depending on the configuration.
-
+	Hence this switches to background() logging,
+	such that the reactor never does log I/O.
+	Keywords size= and policy= are passed to background(),
+	everything else goes to setup().  The policy defaults to
+	OLDEST (or PYTHON_LOG_POLICY), as with BLOCK a full queue
+	would stall the reactor on the writer again.
+
+	The caller is still determined by the thread which logs,
+	so the currentframe() patch below keeps working.
 	You must not have touched twisted.logging before,
 	else it might get the wrong currentframe().
 
-	Currently no workaround is known by me, see my (Tino's) comment at
+	See also my (Tino's) comment at
 	https://stackoverflow.com/a/2493725
 	'''
 
@@ -364,6 +1071,14 @@ def twisted(*args, **kw):
 	# Patch in our stackframe hack
 	ts.currentframe =	_removeWrapperFrames(ts.currentframe, same=True)
 
+	background(kw.pop('size', None), _nonblocking(kw.pop('policy', None)))
+
+	# Do not install the default reactor here, the application might want another one.
+	# Without a reactor everything left is written at exit anyway.
+	reactor	= _sys.modules.get('twisted.internet.reactor')
+	if reactor:
+		reactor.addSystemEventTrigger('after', 'shutdown', flush)
+
 	if args or kw:
 		setup(*args, **kw)
 
@@ -372,13 +1087,23 @@ def twisted(*args, **kw):
 	return __module__
 
 
+def _nonblocking(policy):
+	# Event loops must not wait for the writer, so drop records instead
+	return policy or _os.getenv('PYTHON_LOG_POLICY') or OLDEST
+
+
 def asyncio(*args, **kw):
 	'''
 	Enable this module for asyncio logging.
-
-	NOT YET READY (logging is blocking)
+	This switches to background() logging,
+	such that the event loop never blocks on log I/O.
+	Keywords size= and policy= are passed to background(),
+	everything else goes to setup().  The policy defaults to
+	OLDEST (or PYTHON_LOG_POLICY), see twisted().
 	'''
 
+	background(kw.pop('size', None), _nonblocking(kw.pop('policy', None)))
+
 	if args or kw:
 		setup(*args, **kw)
 
@@ -387,6 +1112,885 @@ def asyncio(*args, **kw):
 	return __module__
 
 
+_PLAIN	= frozenset((str, int, float, bool, bytes, type(None)))	# immutable
+
+def _plain(vals):
+	for v in vals:
+		if type(v) not in _PLAIN:
+			return False
+	return True
+
+
+class _Background(_logging.Handler):
+	'''
+	Replaces all handlers of the root logger.
+	Records are only queued by the caller,
+	formatting and output is done by a writer thread.
+	'''
+	def __init__(self, handlers, size, policy):
+		_logging.Handler.__init__(self)
+		self.handlers	= handlers
+		self.size	= size
+		self.policy	= policy
+		self._start()
+
+	def _start(self):
+		# Also called in a forked child, where the writer thread is gone
+		self.queue	= _collections.deque()
+		self.dropped	= 0
+		self.busy	= False
+		self.stop	= False
+		lock		= _threading.Lock()
+		self.more	= _threading.Condition(lock)	# writer waits for records
+		self.room	= _threading.Condition(lock)	# callers wait for the writer
+		self.thread	= _threading.Thread(target=self._run, name=__name__)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def handle(self, record):
+		# We have our own locking, no need for the handler lock
+		if self.filter(record):
+			self.emit(record)
+		return record
+
+	def emit(self, record):
+		# Capture the message now, as args might change later,
+		# unless they cannot (then _BinarySink gets them as they are).
+		# Formatting (time, exceptions etc.) is left to the writer.
+		if record.args:
+			if type(record.msg) is not str or type(record.args) is not tuple or not _plain(record.args):
+				record.msg	= record.getMessage()
+				record.args	= None
+		elif isinstance(record.msg, _Args):
+			m	= record.msg
+			if not _plain(m.args) or not _plain(m.kw.values()):
+				str(m)
+		with self.more:
+			if len(self.queue) >= self.size and not self.stop:
+				if self.policy == OLDEST:
+					old	= self.queue.popleft()
+					self.dropped	+= 1
+					if _counts is not None:
+						_count(getattr(old, 'pytino_mod', old.name), old.levelno, 3)
+				elif self.policy == NEWEST or self.thread is _threading.current_thread():
+					self.dropped	+= 1
+					if _counts is not None:
+						_count(getattr(record, 'pytino_mod', record.name), record.levelno, 3)
+					return
+				else:
+					# the writer swaps the queue, so always use self.queue here
+					while len(self.queue) >= self.size and not self.stop:
+						self.room.wait()
+			self.queue.append(record)
+			self.more.notify()
+
+	def _run(self):
+		while True:
+			with self.more:
+				while not self.queue and not self.stop:
+					self.busy	= False
+					self.room.notify_all()
+					self.more.wait()
+				if not self.queue:
+					self.busy	= False
+					self.room.notify_all()
+					return
+				self.busy	= True
+				batch		= self.queue
+				self.queue	= _collections.deque()
+				dropped		= self.dropped
+				self.dropped	= 0
+				self.room.notify_all()
+			if dropped:
+				batch.append(_logging.LogRecord(_logging.getLogger().name, WARNING, __file__, 0, 'log overflow: %d records dropped', (dropped,), None, '_run'))
+			self._write(batch)
+
+	def _write(self, batch):
+		for r in batch:
+			for h in self.handlers:
+				if r.levelno >= h.level:
+					h.handle(r)
+		for h in self.handlers:
+			if not getattr(h, 'buffered', False):
+				h.flush()
+
+	def flush(self):
+		'''
+		Wait until the writer has processed everything queued so far.
+		'''
+		if self.thread is _threading.current_thread():	return
+		with self.more:
+			while self.thread.is_alive() and (self.queue or self.busy):
+				self.room.wait()
+		for h in self.handlers:
+			h.flush()
+
+	def close(self):
+		with self.more:
+			self.stop	= True
+			self.more.notify()
+			self.room.notify_all()
+		if self.thread is not _threading.current_thread():
+			self.thread.join()
+		_logging.Handler.close(self)
+
+
+def background(size=None, policy=None):
+	'''
+	Move log output into a background thread.
+	Callers only capture the record and queue it,
+	formatting and writing is done by the writer thread.
+	size:	maximum number of queued records (default 10000)
+	policy:	what to do if the queue is full:
+		BLOCK:	wait for the writer (default)
+		OLDEST:	drop the oldest queued record
+		NEWEST:	drop the new record
+	Dropped records are counted and reported by the writer.
+	Everything left is written at exit or by flush().
+	Calling it again just changes size and policy.
+	'''
+	if size is None:
+		size	= int(_os.getenv('PYTHON_LOG_QUEUE') or 10000)
+	if policy is None:
+		policy	= _os.getenv('PYTHON_LOG_POLICY') or BLOCK
+	if policy not in (BLOCK, OLDEST, NEWEST):
+		raise ValueError('unknown log overflow policy {}'.format(policy))
+
+	q	= __module__._background
+	if q:
+		q.size		= size
+		q.policy	= policy
+		return __module__
+
+	root	= _logging.getLogger()
+	q	= _Background(list(root.handlers), size, policy)
+	for h in q.handlers:
+		root.removeHandler(h)
+	root.addHandler(q)
+	__module__._background	= q
+
+	_atexit.register(q.close)	# in a fork _forked() restarts the writer
+
+	return __module__
+
+
+def flush():
+	'''
+	Flush all pending log output.
+	With background() this waits until everything is written.
+	'''
+	_unlimit(True)
+	for h in _logging.getLogger().handlers:
+		h.flush()
+
+
+def _addHandler(h):
+	'''
+	Add an output handler, honoring background()
+	'''
+	q	= __module__._background
+	if q:
+		q.handlers.append(h)
+	else:
+		_root.addHandler(h)
+
+
+def logfile(path, size=None, rotate=None, keep=None, compress=None, buffer=None, flush=None, sync=None, binary=None):
+	'''
+	Add a buffered, rotating log file.
+	Defaults are taken from the environment (PYTHON_LOG_FILE_*):
+	size:	 SIZE:		rotate if the file grows beyond (like 10M), default 0 (never)
+	rotate:	 ROTATE:	rotate every N seconds (like 1d), default 0 (never)
+	keep:	 KEEP:		keep that many rotated files, default 0 (all)
+	compress: COMPRESS:	gzip rotated files in background if set
+	buffer:	 BUFFER:	bytes to buffer before writing, default 64k
+	flush:	 FLUSH:		write the buffer at least every N seconds, default 1s
+	sync:	 SYNC:		write immediately at this level or above, default ERROR
+	binary:	 BINARY:	write compact binary records instead of text, see decode()
+	Rotated files get the UTC timestamp as suffix: path.YYYYmmdd-HHMMSS
+	'''
+	if size is None:	size	 = _envunit('PYTHON_LOG_FILE_SIZE', 0, _BYTES)
+	if rotate is None:	rotate	 = _envunit('PYTHON_LOG_FILE_ROTATE', 0, _SECS)
+	if keep is None:	keep	 = _envunit('PYTHON_LOG_FILE_KEEP', 0, {})
+	if compress is None:	compress = bool(_os.getenv('PYTHON_LOG_FILE_COMPRESS'))
+	if buffer is None:	buffer	 = _envunit('PYTHON_LOG_FILE_BUFFER', 65536, _BYTES)
+	if flush is None:	flush	 = _envunit('PYTHON_LOG_FILE_FLUSH', 1, _SECS)
+	if sync is None:	sync	 = _envlevel('PYTHON_LOG_FILE_SYNC', ERROR)
+	if binary is None:	binary	 = bool(_os.getenv('PYTHON_LOG_FILE_BINARY'))
+
+	h	= (_BinarySink if binary else _FileSink)(path, size, rotate, keep, compress, buffer, sync)
+	h.setFormatter(_formatter())
+	_addHandler(h)
+	if flush:
+		_every(flush, h.flush)
+	return h
+
+
+class _FileSink(_logging.Handler):
+	'''
+	Buffered log file with rotation, see logfile().
+	Records are collected and written with a single write().
+	'''
+	buffered	= True	# do not flush() after each record, see _Background
+
+	def __init__(self, path, size, rotate, keep, compress, buffer, sync):
+		_logging.Handler.__init__(self)
+		self.path	= _os.path.abspath(path)
+		self.size	= size
+		self.rotate	= rotate
+		self.keep	= keep
+		self.compress	= compress
+		self.buffer	= buffer
+		self.sync	= sync
+		self.buf	= []
+		self.len	= 0
+		self.fd		= None
+		self.last	= (None, 0)	# name and number of the last rotation
+		self._open()
+
+	def _open(self):
+		self.fd		= _os.open(self.path, _os.O_WRONLY|_os.O_APPEND|_os.O_CREAT, 0o666)
+		self.pos	= _os.fstat(self.fd).st_size
+		self.next	= self.rotate and (int(_time.time()) // self.rotate + 1) * self.rotate
+
+	def _encode(self, record):
+		return (self.format(record) + '\n').encode('utf-8', 'backslashreplace')
+
+	def _chunk(self, buf):
+		return b''.join(buf)
+
+	def emit(self, record):
+		try:
+			s	= self._encode(record)
+		except Exception:
+			self.handleError(record)
+			return
+		if _counts is not None:
+			_written(record, len(s))
+		self.buf.append(s)
+		self.len	+= len(s)
+		if self.len >= self.buffer or record.levelno >= self.sync:
+			self._write()
+
+	def flush(self):
+		self.acquire()
+		try:
+			self._write()
+		finally:
+			self.release()
+
+	def _write(self):
+		if not self.buf or self.fd is None:
+			return
+		buf, n		= self.buf, self.len
+		self.buf	= []
+		self.len	= 0
+		try:
+			if self.pos and (self.size and self.pos + n > self.size or self.next and _time.time() >= self.next):
+				self._rotate()
+			data	= self._chunk(buf)
+			v	= memoryview(data)
+			while v:
+				v	= v[_os.write(self.fd, v):]
+			self.pos	+= len(data)
+		except Exception:
+			self.handleError(None)
+
+	def _rotate(self):
+		_os.close(self.fd)
+		self.fd	= None
+		name	= self.path + '.' + _time.strftime(_SANEDATE, _time.gmtime())
+		i	= self.last[1] + 1 if self.last[0] == name else 0	# names must not be reused after _cleanup()
+		n	= '%s-%d' % (name, i) if i else name
+		while _os.path.exists(n) or _os.path.exists(n + '.gz'):
+			i	+= 1
+			n	= '%s-%d' % (name, i)
+		_os.rename(self.path, n)
+		self.last	= (name, i)
+		self._open()
+		if self.compress:
+			t	= _threading.Thread(target=self._compress, args=(n,), name=__name__)
+			t.daemon	= True
+			t.start()
+		else:
+			self._cleanup()
+
+	def _compress(self, name):
+		import gzip
+		import shutil
+		try:
+			with open(name, 'rb') as i, gzip.open(name + '.gz.tmp', 'wb') as o:
+				shutil.copyfileobj(i, o, 1<<20)
+			_os.rename(name + '.gz.tmp', name + '.gz')
+			_os.unlink(name)
+		except Exception:
+			self.handleError(None)
+		self._cleanup()
+
+	def _cleanup(self):
+		if not self.keep:
+			return
+		d, b	= _os.path.split(self.path)
+		rx	= _re.compile(_re.escape(b) + r'\.(\d{8}-\d{6})(?:-(\d+))?(?:\.gz)?$')
+		old	= []
+		for n in _os.listdir(d):
+			m	= rx.match(n)
+			if m:
+				old.append((m.group(1), int(m.group(2) or 0), n))
+		old.sort()
+		for _, _, n in old[:-self.keep]:
+			try:
+				_os.unlink(_os.path.join(d, n))
+			except OSError:
+				pass
+
+	def close(self):
+		self.acquire()
+		try:
+			self._write()
+			if self.fd is not None:
+				_os.close(self.fd)
+				self.fd	= None
+		finally:
+			self.release()
+		_unevery(self.flush)
+		_logging.Handler.close(self)
+
+
+# Binary log files, see _BinarySink
+_MAGIC		= b'\0PYTINOLOG1\n'
+_DOUBLE		= _struct.Struct('<d')
+_VARINT		= [_struct.pack('B', i) for i in range(128)]
+
+def _varint(n):
+	if n < 128:
+		return _VARINT[n]
+	b	= bytearray()
+	while n > 0x7f:
+		b.append(n & 0x7f | 0x80)
+		n	>>= 7
+	b.append(n)
+	return bytes(b)
+
+def _binstr(s):
+	b	= s.encode('utf-8', 'surrogatepass')
+	return _varint(len(b)) + b
+
+
+class _BinarySink(_FileSink):
+	'''
+	Log file with compact binary records, see logfile() and decode().
+	Nothing is rendered, the arguments are written as they are
+	(str, int, float, bytes, bool and None, else their str()).
+	Call sites, logger names, keywords and format strings
+	are written once and then referred to by number.
+
+	The file is a sequence of chunks (one per write):
+		P pid base size		base is the time in microseconds
+	followed by size bytes of frames:
+		S id name path line func	define call site
+		K id string			define string
+		R site level time kind ..	record, time relative to base
+	Definitions are per pid, so several processes can write the same file.
+	The definitions are repeated on a new file and in forked children,
+	then they are forgotten and defined again when used.  After limit
+	definitions, they are forgotten as well, so ids are reused.
+	In background() the arguments are only written as they are if they
+	are plain values (see _PLAIN), else the caller renders the message.
+	'''
+	limit	= 4096		# definitions kept, see _forget()
+
+	def _open(self):
+		_FileSink._open(self)
+		self.fresh	= True
+
+	def __init__(self, *args):
+		self.sites	= {}	# ( name, path, line, func ) -> id
+		self.strings	= {}	# string -> id
+		self.defs	= []	# all definitions, to be repeated
+		self.base	= 0
+		self.pid	= _os.getpid()
+		_FileSink.__init__(self, *args)
+
+	def _chunk(self, buf):
+		body	= b''.join(buf)
+		pid	= _os.getpid()
+		if self.fresh or pid != self.pid:
+			self.fresh	= False
+			self.pid	= pid
+			body		= b''.join(self.defs) + body
+			self._forget()
+		return (b'' if self.pos else _MAGIC) + b'P' + _varint(pid) + _varint(self.base) + _varint(len(body)) + body
+
+	def _def(self, d, pre):
+		self.defs.append(d)
+		pre	+= d
+
+	def _forget(self):
+		# ids are defined again when used, the decoder takes the latest
+		self.sites	= {}
+		self.strings	= {}
+		self.defs	= []
+
+	def _str(self, s, pre):
+		i	= self.strings.get(s)
+		if i is None:
+			i	= self.strings[s] = len(self.strings)
+			self._def(b'K' + _varint(i) + _binstr(s), pre)
+		return _varint(i)
+
+	def _val(self, v, o):
+		t	= type(v)
+		if t is str:
+			o	+= b's'
+			o	+= _binstr(v)
+		elif t is int:
+			o	+= b'i'
+			o	+= _varint(v << 1 if v >= 0 else (-v << 1) - 1)
+		elif v is None:
+			o	+= b'N'
+		elif t is bool:
+			o	+= b'T' if v else b'F'
+		elif t is float:
+			o	+= b'f'
+			o	+= _DOUBLE.pack(v)
+		elif t is bytes:
+			o	+= b'b'
+			o	+= _varint(len(v))
+			o	+= v
+		else:
+			try:
+				v	= str(v)
+			except Exception as e:
+				v	= '(exception '+str(e)+')'
+			o	+= b's'
+			o	+= _binstr(v)
+
+	def _encode(self, r):
+		if len(self.defs) >= self.limit:
+			self._write()	# the buffered records need the old ids
+			self._forget()
+		pre	= bytearray()
+		key	= (r.name, r.pathname, r.lineno, r.funcName)
+		site	= self.sites.get(key)
+		if site is None:
+			site	= self.sites[key] = len(self.sites)
+			self._def(b'S' + _varint(site) + _binstr(r.name) + _binstr(r.pathname) + _varint(r.lineno) + _binstr(r.funcName), pre)
+		t	= int(r.created * 1000000)
+		if not self.buf:
+			self.base	= t
+		t	-= self.base
+		o	= bytearray(b'R')
+		o	+= _varint(site)
+		o	+= _varint(r.levelno)
+		o	+= _varint(t << 1 if t >= 0 else (-t << 1) - 1)
+
+		m	= r.msg
+		if isinstance(m, _Args) and m.s is None and not r.args:
+			o	+= b'A'
+			o	+= _varint(len(m.args))
+			for v in m.args:
+				self._val(v, o)
+			o	+= _varint(len(m.kw))
+			for k, v in m.kw.items():
+				o	+= self._str(str(k), pre)
+				self._val(v, o)
+		elif isinstance(m, str) and isinstance(r.args, tuple) and r.args:
+			o	+= b'X'
+			o	+= self._str(m, pre)
+			o	+= _varint(len(r.args))
+			for v in r.args:
+				self._val(v, o)
+		else:
+			o	+= b'M'
+			o	+= _binstr(r.getMessage())
+
+		exc	= r.exc_text
+		if r.exc_info and not exc:
+			exc	= r.exc_text = (self.formatter or _logging._defaultFormatter).formatException(r.exc_info)
+		o	+= b'E' + _binstr(exc) if exc else b'-'
+		o	+= b'S' + _binstr(r.stack_info) if r.stack_info else b'-'
+		if pre:
+			pre	+= o
+			return pre
+		return o
+
+
+class _BinReader(object):
+	__slots__	= ('b', 'i')
+
+	def __init__(self, b):
+		self.b	= b
+		self.i	= 0
+
+	def byte(self):
+		c	= self.b[self.i:self.i+1]
+		self.i	+= 1
+		return c
+
+	def var(self):
+		n	= 0
+		s	= 0
+		while True:
+			c	= self.b[self.i]
+			self.i	+= 1
+			n	|= (c & 0x7f) << s
+			if c < 0x80:
+				return n
+			s	+= 7
+
+	def zig(self):
+		n	= self.var()
+		return -((n + 1) >> 1) if n & 1 else n >> 1
+
+	def raw(self):
+		n	= self.var()
+		self.i	+= n
+		return bytes(self.b[self.i-n:self.i])
+
+	def str(self):
+		return self.raw().decode('utf-8', 'surrogatepass')
+
+	def val(self):
+		t	= self.byte()
+		if t == b's':	return self.str()
+		if t == b'i':	return self.zig()
+		if t == b'N':	return None
+		if t == b'T':	return True
+		if t == b'F':	return False
+		if t == b'f':
+			self.i	+= 8
+			return _DOUBLE.unpack_from(self.b, self.i-8)[0]
+		if t == b'b':	return self.raw()
+		raise ValueError('binary log: unknown value type {!r}'.format(t))
+
+
+def decode(f, fmt=None):
+	'''
+	Decode a binary log file (see logfile()) opened in binary mode.
+	This is a generator returning the lines as written by logfile(),
+	but formatted with fmt (default: the current format,
+	so PYTHON_LOG_DEBUG gives the full path) and the current escape().
+	From the command line: python3 -m pytino.log file..
+	'''
+	form	= _formatter(fmt or _format)
+	tabs	= {}	# pid -> ( sites, strings )
+	while True:
+		c	= f.read(1)
+		if not c:
+			return
+		if c == _MAGIC[:1]:
+			if f.read(len(_MAGIC)-1) != _MAGIC[1:]:
+				raise ValueError('not a binary log file')
+			continue
+		if c != b'P':
+			raise ValueError('binary log: chunk expected')
+		head	= []
+		while len(head) < 3:
+			n	= 0
+			s	= 0
+			while True:
+				c	= f.read(1)
+				if not c:
+					return		# truncated by a crash
+				c	= ord(c)
+				n	|= (c & 0x7f) << s
+				s	+= 7
+				if c < 0x80:
+					break
+			head.append(n)
+		pid, base, size	= head
+		body	= f.read(size)
+		if len(body) < size:
+			return
+		sites, strings	= tabs.setdefault(pid, ({}, {}))
+		b	= _BinReader(memoryview(body))
+		while b.i < size:
+			t	= b.byte()
+			if t == b'S':
+				i	= b.var()
+				sites[i]	= (b.str(), b.str(), b.var(), b.str())
+				continue
+			if t == b'K':
+				i	= b.var()
+				strings[i]	= b.str()
+				continue
+			if t != b'R':
+				raise ValueError('binary log: unknown frame {!r}'.format(t))
+			name, path, line, func	= sites[b.var()]
+			lvl	= b.var()
+			when	= (base + b.zig()) / 1000000.
+			t	= b.byte()
+			args	= None
+			if t == b'A':
+				a	= tuple(b.val() for i in range(b.var()))
+				kw	= dict((strings[b.var()], b.val()) for i in range(b.var()))
+				msg	= _Args(a, kw)
+			elif t == b'X':
+				msg	= strings[b.var()]
+				args	= tuple(b.val() for i in range(b.var()))
+			else:
+				msg	= b.str()
+			exc	= b.str() if b.byte() == b'E' else None
+			stack	= b.str() if b.byte() == b'S' else None
+			r	= _logging.makeLogRecord(dict(name=name, levelno=lvl, levelname=_logging.getLevelName(lvl),
+					pathname=path, filename=_os.path.basename(path), module=_os.path.splitext(_os.path.basename(path))[0],
+					lineno=line, funcName=func, created=when, msecs=(when - int(when)) * 1000,
+					msg=msg, args=args, exc_text=exc, stack_info=stack, process=pid))
+			yield form.format(r)
+
+
+def _prefork():
+	# Do not leave buffered output to the child, it would be written twice
+	for h in _handlers():
+		if getattr(h, 'buffered', False):
+			h.flush()
+
+def _forked():
+	# Threads are not inherited, so restart the writer first
+	# (its locks might be held by the parent's writer), then the ticker
+	# (the parent's ticker might hold _tick)
+	if _background:
+		_background._start()
+	__module__._tick	= _threading.Condition()
+	__module__._ticker	= None
+	if _ticks:
+		_every(0, None)
+	for h in _root.handlers:
+		if isinstance(h, _Shipper):
+			h.reset()	# the connection is the parent's
+	if _collector:
+		_ship(_collector.path)
+
+
+def collect(path=None):
+	'''
+	Collect the log output of child processes (multi process logging):
+	Children send their records to a socket (path),
+	this process writes them with its own handlers.
+	Records are ordered by time and get name[pid] as name.
+	Forked children are switched automatically,
+	others get PYTHON_LOG_COLLECT via the environment.
+	Children log in background() with policy NEWEST,
+	so a slow collector never blocks them (records are dropped then).
+	Returns the path of the socket.
+	'''
+	if _collector:
+		return _collector.path
+	if path is None:
+		import tempfile
+		path	= _os.path.join(tempfile.mkdtemp(prefix='pytino-log-'), 'sock')	# 0700
+	__module__._collector	= _Collector(path)
+	_os.environ['PYTHON_LOG_COLLECT']	= path
+	_atexit.register(_collector.close)	# inherited by forks, see close()
+	return path
+
+
+def _netimport():
+	# Import before any thread does: a fork during the first import
+	# in a thread leaves the child with a half initialized module
+	import json, socket, selectors
+
+
+class _Collector(object):
+	'''
+	Thread which receives the records of the children, see collect()
+	Records are plain JSON data, never code (like pickle).
+	'''
+	def __init__(self, path):
+		_netimport()
+		import socket
+		import selectors
+		self.pid	= _os.getpid()
+		self.path	= path
+		self.sel	= selectors.DefaultSelector()
+		self.sock	= socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.bind(path)
+		self.sock.listen(128)
+		self.sock.setblocking(False)
+		self.wake, self.woken	= socket.socketpair()
+		self.sel.register(self.sock, selectors.EVENT_READ, None)
+		self.sel.register(self.woken, selectors.EVENT_READ, None)
+		self.stop	= False
+		self.thread	= _threading.Thread(target=self._run, name=__name__)
+		self.thread.daemon	= True
+		self.thread.start()
+
+	def _run(self):
+		import selectors
+		while True:
+			batch	= []
+			for k, ev in self.sel.select(0 if self.stop else 1):
+				if k.fileobj is self.sock:
+					c, _	= self.sock.accept()
+					c.setblocking(False)
+					self.sel.register(c, selectors.EVENT_READ, bytearray())
+				elif k.fileobj is self.woken:
+					self.woken.recv(1)
+				else:
+					self._read(k.fileobj, k.data, batch)
+			# the children are independent, so restore some order
+			batch.sort(key=lambda r: r.created)
+			for r in batch:
+				_root.handle(r)
+			if self.stop and not batch:
+				return
+
+	def _read(self, c, buf, batch):
+		import json
+		try:
+			d	= c.recv(1<<20)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			d	= b''
+		if not d:
+			self.sel.unregister(c)
+			c.close()
+			return
+		buf	+= d
+		i	= 0
+		while len(buf) - i >= 4:
+			n	= int.from_bytes(buf[i:i+4], 'big')
+			if len(buf) - i - 4 < n:
+				break
+			i	+= 4 + n
+			try:
+				d	= json.loads(buf[i-n:i].decode('utf-8'))
+			except ValueError:
+				continue
+			if not isinstance(d, dict) or not isinstance(d.get('levelno'), int) or not isinstance(d.get('created'), (int, float)):
+				continue	# not from a _Shipper
+			d['args']	= None
+			d['exc_info']	= None
+			r	= _logging.makeLogRecord(d)
+			r.name	= '%s[%s]' % (r.name, r.process)
+			if r.__dict__.pop('pytino_args', False):
+				r.msg	= _Args((), {})
+				r.msg.s	= str(d.get('message'))
+			batch.append(r)
+		del buf[:i]
+
+	def close(self):
+		if _os.getpid() != self.pid:
+			return		# a fork, the collector belongs to the parent
+		self.stop	= True
+		self.wake.send(b'x')
+		self.thread.join()
+		self.sock.close()
+		try:
+			_os.unlink(self.path)
+			_os.rmdir(_os.path.dirname(self.path))
+		except OSError:
+			pass
+
+
+def _ship(path):
+	'''
+	Become a child of collect():
+	replace the output handlers by a _Shipper in background().
+	'''
+	_netimport()
+	__module__._collector	= None
+	q	= __module__._background
+	if q:
+		_root.removeHandler(q)
+		q.close()	# in a fork the thread is gone anyway
+		__module__._background	= None
+	for h in list(_root.handlers):
+		_root.removeHandler(h)
+		if isinstance(h, _FileSink):
+			h.buf	= []	# this belongs to the parent
+			_unevery(h.flush)
+	_root.addHandler(_Shipper(path))
+	background(policy=NEWEST)
+
+
+class _Shipper(_logging.Handler):
+	'''
+	Send records to the collector, see collect()
+	If the collector is not reachable, the records go to stderr.
+	'''
+	def __init__(self, path):
+		_logging.Handler.__init__(self)
+		self.path	= path
+		self.sock	= None
+
+	def emit(self, record):
+		import json
+		try:
+			d	= dict(record.__dict__)
+			d['msg']	= d['message'] = record.getMessage()
+			d['args']	= None
+			d['exc_info']	= None
+			d['pytino_args']	= isinstance(record.msg, _Args)
+			d.pop('pytino_bytes', None)	# counted by the collector
+			if record.exc_info and not record.exc_text:
+				d['exc_text']	= _logging.Formatter().formatException(record.exc_info)
+			d	= json.dumps(d, default=str).encode('utf-8')
+		except Exception:
+			self.handleError(record)
+			return
+		try:
+			if self.sock is None:
+				import socket
+				self.sock	= socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				self.sock.connect(self.path)
+			self.sock.sendall(len(d).to_bytes(4, 'big') + d)
+		except OSError:
+			self.reset()
+			_logging.lastResort.handle(record)
+
+	def reset(self):
+		if self.sock:
+			self.sock.close()
+			self.sock	= None
+
+	def close(self):
+		self.reset()
+		_logging.Handler.close(self)
+
+
+# A single background thread for periodic tasks, see _every()
+_ticks		= []
+_tick		= _threading.Condition()
+_ticker		= None
+
+def _every(secs, fn):
+	'''
+	Call fn() every secs seconds from a background thread
+	'''
+	with _tick:
+		if fn:
+			_ticks.append([_time.time() + secs, secs, fn])
+		if _ticker is None or not _ticker.is_alive():
+			t	= _threading.Thread(target=_ticking, name=__name__)
+			t.daemon	= True
+			t.start()
+			__module__._ticker	= t
+		_tick.notify()
+
+def _unevery(fn):
+	with _tick:
+		_ticks[:]	= [t for t in _ticks if t[2] != fn]
+
+def _ticking():
+	while True:
+		with _tick:
+			now	= _time.time()
+			due	= [t for t in _ticks if t[0] <= now]
+			for t in due:
+				t[0]	= now + t[1]
+			if not due:
+				_tick.wait(min([t[0] for t in _ticks] or [60]) - now)
+				continue
+		for t in due:
+			try:
+				t[2]()
+			except Exception:
+				pass
+
+
 NONE	= 0
 ALL	= 1
 DEBUG	= _logging.DEBUG
@@ -404,7 +2008,26 @@ def debug(*args, **kw):	log(DEBUG,   *args, **kw)
 def info (*args, **kw):	__module__.log(__module__.INFO,    *args, **kw)
 def warn (*args, **kw):	__module__.log(__module__.WARNING, *args, **kw)
 def err  (*args, **kw):	__module__.log(__module__.ERROR,   *args, **kw)
-def fatal(*args, **kw):	__module__.log(__module__.FATAL,   *args, **kw)
+def fatal(*args, **kw):
+	__module__.log(__module__.FATAL, *args, **kw)
+	if _ring: dump('fatal')
+
+
+def _nop(*args, **kw):
+	pass
+
+def _rebind():
+	'''
+	Wrappers below the level become no-ops, such that
+	suppressed calls cost a function call and nothing more.
+	This swaps the __code__ only, so the functions
+	and their injected attributes stay the same.
+	ring() and metrics() need all records, hence then nothing is swapped.
+	'''
+	for fn, lvl, code in _wrappers:
+		fn.__code__	= _nop.__code__ if _level is not None and lvl < _level and not _ring and _counts is None else code
+
+_wrappers	= tuple((fn, lvl, fn.__code__) for fn, lvl in ((ll, ALL), (debug, DEBUG), (info, INFO), (warn, WARNING), (err, ERROR), (fatal, FATAL)))
 
 
 # Do all the patching stuff, once for a lifetime.
@@ -435,8 +2058,66 @@ def _test():
 	log("this cannot be seen")
 
 	sep()
+	_testfork()
+	sep()
+
+
+def _testfork(rounds=100, n=8):
+	'''
+	Fork under load: with the ticker busy, no child may hang in _forked()
+	'''
+	import tempfile
+	d	= tempfile.mkdtemp()
+	setup('fork', INFO)
+	had	= list(_root.handlers)
+	for h in had:
+		_root.removeHandler(h)	# only to the file
+	h	= logfile(_os.path.join(d, 'log'), flush=0.0001)
+	bad	= 0
+	for r in range(rounds):
+		pids	= []
+		for i in range(n):
+			info('parent', r, i)
+			pid	= _os.fork()
+			if not pid:
+				info('child', r, i)
+				flush()
+				_os._exit(0)
+			pids.append(pid)
+		end	= _time.time() + 5
+		while pids:
+			for pid in list(pids):
+				if _os.waitpid(pid, _os.WNOHANG)[0]:
+					pids.remove(pid)
+			if pids and _time.time() > end:
+				for pid in pids:
+					_os.kill(pid, 9)
+					_os.waitpid(pid, 0)
+				bad	+= len(pids)
+				break
+			_time.sleep(0.001)
+	flush()
+	_root.removeHandler(h)
+	h.close()
+	for x in had:
+		_root.addHandler(x)
+	with open(h.path) as f:
+		kids	= sum(1 for l in f if ' child ' in l)
+	_os.unlink(h.path)
+	_os.rmdir(d)
+	print('forks', rounds * n, 'hung', bad, 'logged', kids)
+	if bad or kids != rounds * n:
+		_sys.exit(1)
 
 
 if __name__=='__main__':
-	_test()
+	if _sys.argv[1:]:
+		# running as __main__ switches to _FULLFORMAT, see __DEBUGGING__
+		fmt	= _os.getenv('PYTHON_LOG_FORMAT') or _os.getenv('PYTHON_LOG_DEBUG') and _FULLFORMAT or _SANEFORMAT
+		for a in _sys.argv[1:]:
+			with open(a, 'rb') as f:
+				for l in decode(f, fmt):
+					print(l)
+	else:
+		_test()
 
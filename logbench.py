@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+#
+# Benchmark of the hot path of pytino.log
+#
+# vim:set ts=8:
+#
+# This Works is placed under the terms of the Copyright Less License,
+# see file COPYRIGHT.CLL.  USE AT OWN RISK, ABSOLUTELY NO WARRANTY.
+#
+# Usage:
+#	python3 -m pytino.logbench		# or: make bench
+#	python3 -m pytino.logbench -n 20000 info	# only cases containing "info"
+#	python3 -m pytino.logbench --json > new.json	# for comparison
+#
+# Reported are:
+#	ns/call:	best of the repeats
+#	peak:		peak of traced memory above start (bytes, includes buffers)
+#	blocks/call:	memory blocks still allocated afterwards (should be 0)
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import time
+import json
+import types
+import logging
+import tempfile
+import argparse
+import tracemalloc
+
+try:
+	import pytino.log as log
+except ImportError:
+	# not installed: this checkout is pytino, whatever its directory is called
+	import importlib.util
+	_here	= os.path.dirname(os.path.abspath(__file__))
+	_spec	= importlib.util.spec_from_file_location('pytino', os.path.join(_here, '__init__.py'), submodule_search_locations=[_here])
+	sys.modules['pytino']	= importlib.util.module_from_spec(_spec)
+	_spec.loader.exec_module(sys.modules['pytino'])
+	import pytino.log as log
+
+
+def sink(kind):
+	'''
+	Set the output of the root logger:
+		stream:	StreamHandler to /dev/null (like stderr, but silent)
+		stderr:	the real stderr
+		file:	log.logfile() in a temporary directory
+		binary:	the same with binary=True
+	'''
+	for h in list(log._root.handlers):
+		log._root.removeHandler(h)
+		if h not in (stream, stderr):
+			h.close()
+	if kind == 'stream':
+		h	= stream
+	elif kind == 'stderr':
+		h	= stderr
+	else:
+		h	= log.logfile(os.path.join(tmp, 'bench.'+kind), size=1<<26, keep=1, binary=kind == 'binary')
+		log._root.removeHandler(h)
+	h.setFormatter(log._formatter())
+	log._root.addHandler(h)
+
+
+def wrappers(depth, fn):
+	'''
+	Chain of depth modules with __LOGWRAPPER__ = logging around fn
+	'''
+	for i in range(depth):
+		m	= types.ModuleType('logbench_wrap%d' % i)
+		m.__dict__.update(__LOGWRAPPER__=logging, nxt=fn)
+		exec('def w(*a, **k): nxt(*a, **k)', m.__dict__)
+		sys.modules[m.__name__]	= m
+		fn	= m.w
+	return fn
+
+
+def module(level):
+	'''
+	Module with __LOGLEVEL__ = level, calling log.info()
+	'''
+	m	= types.ModuleType('logbench_mod')
+	m.__dict__.update(__LOGLEVEL__=level, log=log)
+	exec('def f(i): log.info("module", i)', m.__dict__)
+	sys.modules[m.__name__]	= m
+	return m.f
+
+
+def deep(n, fn):
+	'''
+	Call fn n frames deep (stack depth of the caller)
+	'''
+	def call(i, d=n):
+		return call(i, d-1) if d else fn(i)
+	return call
+
+
+def cases():
+	'''
+	All cases as ( name, level, sink, fn(i) )
+	'''
+	kw	= dict(('key%d' % k, k) for k in range(10))
+	w4	= wrappers(4, log.info)
+	w16	= wrappers(16, log.info)
+	mod	= module(log.ERROR)
+	d50	= deep(50, lambda i: log.info('deep', i))
+
+	for name, lvl in (('suppressed', log.FATAL), ('emitted', log.ALL)):
+		yield name+' ll',	lvl, 'stream', lambda i: log.ll('bench', i)
+		yield name+' debug',	lvl, 'stream', lambda i: log.debug('bench', i)
+		yield name+' info',	lvl, 'stream', lambda i: log.info('bench', i)
+		yield name+' xlog',	lvl, 'stream', lambda i: log.xlog(log.INFO, 'bench %s', i)
+		yield name+' info kw10', lvl, 'stream', lambda i: log.info('bench', i, **kw)
+		yield name+' wrapper4',	lvl, 'stream', lambda i: w4('bench', i)
+		yield name+' wrapper16', lvl, 'stream', lambda i: w16('bench', i)
+		yield name+' deep50',	lvl, 'stream', d50
+	yield 'suppressed __LOGLEVEL__', log.ALL, 'stream', mod
+	yield 'emitted info stderr',	log.ALL, 'stderr', lambda i: log.info('bench', i)
+	yield 'emitted info file',	log.ALL, 'file', lambda i: log.info('bench', i)
+	yield 'emitted info kw10 file',	log.ALL, 'file', lambda i: log.info('bench', i, **kw)
+	yield 'emitted info binary',	log.ALL, 'binary', lambda i: log.info('bench', i)
+	yield 'emitted info kw10 binary', log.ALL, 'binary', lambda i: log.info('bench', i, **kw)
+
+
+def run(fn, n, repeat):
+	'''
+	Returns ( ns/call, peak bytes, blocks/call )
+	'''
+	for i in range(min(n, 100)):	# warm up caches
+		fn(i)
+	best	= None
+	for r in range(repeat):
+		t	= time.perf_counter()
+		for i in range(n):
+			fn(i)
+		t	= time.perf_counter() - t
+		best	= t if best is None or t < best else best
+	log.flush()
+
+	tracemalloc.start()
+	tracemalloc.reset_peak()
+	base	= tracemalloc.get_traced_memory()[0]
+	blocks	= sys.getallocatedblocks()
+	for i in range(n):
+		fn(i)
+	blocks	= sys.getallocatedblocks() - blocks
+	peak	= tracemalloc.get_traced_memory()[1] - base
+	tracemalloc.stop()
+	log.flush()
+	return ( best * 1e9 / n, peak, float(blocks) / n )
+
+
+def main(args):
+	p	= argparse.ArgumentParser(description='Benchmark the hot path of pytino.log')
+	p.add_argument('-n', type=int, default=10000, help='calls per repeat')
+	p.add_argument('-r', '--repeat', type=int, default=5, help='number of repeats')
+	p.add_argument('--json', action='store_true', help='output JSON')
+	p.add_argument('--stderr', action='store_true', help='really write to stderr for the stderr sink')
+	p.add_argument('filter', nargs='*', help='only run cases containing one of these')
+	a	= p.parse_args(args)
+
+	global tmp, stream, stderr
+	tmp	= tempfile.mkdtemp(prefix='logbench-')
+	stream	= logging.StreamHandler(open(os.devnull, 'w'))
+	stderr	= a.stderr and logging.StreamHandler(sys.stderr) or stream
+
+	log.setup('bench')
+	res	= {}
+	for name, lvl, kind, fn in cases():
+		if a.filter and not any(f in name for f in a.filter):
+			continue
+		sink(kind)
+		log.level(lvl)
+		res[name]	= run(fn, a.n, a.repeat)
+		if not a.json:
+			print('%-28s %10.0f ns/call %10d peak %6.2f blocks/call' % ((name,) + res[name]))
+	sink('stream')
+
+	for f in os.listdir(tmp):
+		os.unlink(os.path.join(tmp, f))
+	os.rmdir(tmp)
+
+	if a.json:
+		print(json.dumps(dict((k, dict(zip(('ns', 'peak', 'blocks'), v))) for k, v in res.items()), indent=1, sort_keys=True))
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -4,7 +4,9 @@
 
 from __future__ import absolute_import
 
+import os
 import re
+import sys
 import itertools
 import pytino.log as log
 
@@ -36,7 +38,130 @@ class Keeper(dict):
 			super().__setitem__(idx, val)
 			return val
 
+	def make(self, idx, data):
+		return self.get(idx)
+
+class Record(object):
+	"""
+		Record of a DenseKeeper: slots which can be used like a dict, too:
+			My.get(My.DEBUG).fn	or	My.get(My.DEBUG)['fn']
+	"""
+	__slots__	= ()
+
+	def __getitem__(self, a):
+		try:
+			return getattr(self, a)
+		except AttributeError:
+			raise KeyError(a)
+
+	def __setitem__(self, a, val):
+		setattr(self, a, val)
+
+	def __contains__(self, a):
+		return hasattr(self, a)
+
+	def __iter__(self):
+		return (a for a in self.__slots__ if hasattr(self, a))
+
+	def get(self, a, default=None):
+		return getattr(self, a, default)
+
+	def keys(self):
+		return list(self)
+
+	def items(self):
+		return [(a, getattr(self, a)) for a in self]
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+class DenseKeeper(object):
+	"""
+		Keeper for small numbers (like packet types):
+			reg	= reg.Registry(globals(), keeper=reg.DenseKeeper)
+		Records are Record with slots, numbers below .dense
+		are kept in a list, others in a dict.
+		get() of unknown numbers returns None without allocating.
+		byname() is the reverse lookup.
+	"""
+	dense	= 1024
+
+	def __init__(self):
+		self.recs	= []
+		self.sparse	= {}
+		self.names	= {}
+		self.cls	= Record
+
+	_key	= staticmethod(Keeper._key)
+
+	def __getitem__(self, idx):
+		return self.get(idx)
+
+	def get(self, idx):
+		if type(idx) is not int:
+			idx	= self._key(idx)
+		if 0 <= idx < len(self.recs):
+			return self.recs[idx]
+		return self.sparse.get(idx)
+
+	def byname(self, name):
+		return self.names.get(name)
+
+	def __contains__(self, idx):
+		return self.get(idx) is not None
+
+	def __iter__(self):
+		return itertools.chain((i for i,r in enumerate(self.recs) if r is not None), self.sparse)
+
+	def __len__(self):
+		return len(self.names)
+
+	def keys(self):
+		return list(self)
+
+	def values(self):
+		return [self.get(i) for i in self]
+
+	def items(self):
+		return [(i, self.get(i)) for i in self]
+
+	def _slots(self, fields):
+		# All records of a keeper share a class with the union of all fields
+		slots	= self.cls.__slots__ + tuple(a for a in fields if a not in self.cls.__slots__)
+		cls	= type('Record', (Record,), { '__slots__':slots })
+		for i,r in self.items():
+			n	= cls()
+			for a,v in r.items():
+				setattr(n, a, v)
+			self._store(i, n)
+		self.cls	= cls
+
+	def _store(self, idx, r):
+		if 0 <= idx < self.dense:
+			if idx >= len(self.recs):
+				self.recs.extend([None] * (idx + 1 - len(self.recs)))
+			self.recs[idx]	= r
+		else:
+			self.sparse[idx]	= r
+		if 'name' in r:
+			self.names[r.name]	= r
+
+	def make(self, idx, data):
+		idx	= self._key(idx)
+		if any(a not in self.cls.__slots__ for a in data):
+			self._slots(data)
+		r	= self.get(idx)
+		if r is None:
+			r	= self.cls()
+			self._store(idx, r)
+			if 'name' in data:
+				self.names[data['name']]	= r
+		return r
+
 class Reg:
+	_trusted	= False	# see Registry.freeze()
+	_frozen		= False
+
 	def __init__(self, *args):
 		self.__add__(*args)
 
@@ -52,9 +177,14 @@ class Reg:
 
 	@classmethod
 	def __add__(cls, nr, name, info=None, *args, **kw):
+		if cls._frozen:
+			raise RuntimeError('{}: registry is frozen'.format(cls.__name__))
 		if not hasattr(cls, '_keep'):
 			cls._keep = cls._keeper()
 
+		if cls._trusted:
+			return cls._trust(nr, name, info, *args, **kw)
+
 		id	= cls._id(cls.__name__+'_'+name)
 		if id in cls._glob and cls._glob[id]!=nr:
 			raise RuntimeError('{} already defined differently on module level'.format(id))
@@ -69,7 +199,7 @@ class Reg:
 		data	= { 'nr':nr, 'name':name, 'info':info }
 		cls._reg(data, *args, **kw)
 
-		x = cls._keep.get(nr)
+		x = cls._keep.make(nr, data)
 		for a in data:
 			if not a in x:
 				x[a] = data[a]
@@ -77,6 +207,19 @@ class Reg:
 			elif x[a] != data[a]:
 				raise RuntimeError('{}: Redefined property: {} = {} (was {})'.format(name, a, data[a], x[a]))
 
+	@classmethod
+	def _trust(cls, nr, name, info=None, *args, **kw):
+		# Unchanged source, see Registry.freeze(): everything was checked before
+		cls._glob[cls.__name__+'_'+name] = nr
+		if not hasattr(cls, name):
+			setattr(cls, name, nr)
+		data	= { 'nr':nr, 'name':name, 'info':info }
+		cls._reg(data, *args, **kw)
+		x = cls._keep.make(nr, data)
+		for a in data:
+			if not a in x:
+				x[a] = data[a]
+
 	@classmethod
 	def get(cls, nr): return cls._get(nr)
 	@classmethod
@@ -101,6 +244,81 @@ class Reg:
 			raise
 
 
+class _Unknown(object):
+	__slots__	= ()
+	def __repr__(self):	return 'UNKNOWN'
+	def __bool__(self):	return False
+	__nonzero__	= __bool__
+
+class Dispatch(object):
+	"""
+		Flat table of the fn of a registry (like Fn):
+			run	= My.dispatch()		# or reg.Dispatch(My)
+			run(nr, args..)			# My.get(nr).fn(args..)
+			run.batch([(nr, payload), ..])	# list of results
+		Unknown numbers (and entries without fn) call unknown(nr, args..),
+		which defaults to return Dispatch.UNKNOWN (a false singleton).
+		Create it after everything is registered, see Registry.freeze().
+	"""
+	UNKNOWN	= _Unknown()
+	dense	= 1024
+
+	def __init__(self, reg, unknown=None):
+		self.table	= []
+		self.sparse	= {}
+		self.unknown	= unknown or (lambda nr, *args: Dispatch.UNKNOWN)
+		for nr, r in reg._keep.items():
+			fn	= r.get('fn')
+			if fn is None:
+				continue
+			if 0 <= nr < self.dense:
+				if nr >= len(self.table):
+					self.table.extend([None] * (nr + 1 - len(self.table)))
+				self.table[nr]	= fn
+			else:
+				self.sparse[nr]	= fn
+
+	def __call__(self, nr, *args):
+		t	= self.table
+		fn	= t[nr] if 0 <= nr < len(t) else self.sparse.get(nr)
+		if fn is None:
+			return self.unknown(nr, *args)
+		return fn(*args)
+
+	def batch(self, items, out=None):
+		"""
+		Dispatch (nr, payload) items, results are appended to out
+		"""
+		t	= self.table
+		n	= len(t)
+		sparse	= self.sparse
+		unknown	= self.unknown
+		out	= [] if out is None else out
+		add	= out.append
+		for nr, payload in items:
+			fn	= t[nr] if 0 <= nr < n else sparse.get(nr)
+			add(unknown(nr, payload) if fn is None else fn(payload))
+		return out
+
+
+def _or(nrs):
+	v	= 0
+	for nr in nrs:
+		v	|= nr
+	return v
+
+
+def _stamp(glob):
+	# Source of the registering module and of us, None if unknown
+	try:
+		src	= glob['__file__']
+		st	= [os.stat(f) for f in (src, __file__)]
+	except (KeyError, TypeError, OSError):
+		return None, None
+	path	= os.path.join(os.path.dirname(src), '__pycache__', os.path.splitext(os.path.basename(src))[0] + '.reg')
+	return path, ' '.join('{}:{}'.format(s.st_mtime_ns, s.st_size) for s in st)
+
+
 # I tried to make this a function,
 # but I failed for unknown reason.
 class Registry():
@@ -113,6 +331,16 @@ class Registry():
 		the current module (globals) with My_DEBUG=1.
 		It also keeps the metadata around, like:
 			My.get(My.Debug).fn(args..)
+		For fast calls see Dispatch: My.dispatch()(My.DEBUG, args..)
+
+		For bit flags:
+		class Fl(reg.Flag):	pass
+		Fl(1, "READ"); Fl(2, "WRITE")
+		Fl.decode(7)		# (('READ', 'WRITE'), 4)
+		Fl.encode(['READ', 'WRITE'])	# 3
+
+		At the end of the module:
+		reg.freeze()
 	"""
 	def __init__(self, glob={}, keeper=Keeper, base=Reg):
 		class Reg(base):
@@ -128,6 +356,113 @@ class Registry():
 				data['fn']	= fn
 				cls._fn(data, *args, **kw)
 
+			@classmethod
+			def dispatch(cls, unknown=None):
+				return Dispatch(cls, unknown)
+
+		class Flag(Reg):
+			_tables	= None
+
+			@classmethod
+			def _reg(cls, data):
+				cls._tables	= None
+
+			@classmethod
+			def _table(cls):
+				# ( known bits, [ ( shift, 256 ( names, their bits ) ) ], [ ( wide nr, name ) ] )
+				flags	= sorted((r['nr'], r['name']) for r in cls._keep.values() if r['nr'])
+				known	= 0
+				per	= {}
+				wide	= []
+				for nr, name in flags:
+					known	|= nr
+					shift	= (nr.bit_length() - 1) & ~7
+					if (nr & -nr).bit_length() - 1 < shift:	# spans bytes, test the full mask
+						wide.append((nr, name))
+					else:
+						per.setdefault(shift, []).append((nr >> shift, name))
+				tabs	= []
+				for shift, f in sorted(per.items()):
+					m	= [[nr for nr, name in f if v & nr == nr] for v in range(256)]
+					tabs.append((shift, tuple((tuple(name for nr, name in f if v & nr == nr), _or(m[v])) for v in range(256))))
+				cls._tables	= (known, tabs, wide)
+				return cls._tables
+
+			@classmethod
+			def decode(cls, mask):
+				"""
+				Returns ( names, leftover bits ) of mask.
+				Bits of partially set flags are left over,
+				so encode(names + (leftover,)) gives mask again.
+				"""
+				known, tabs, wide	= cls._tables or cls._table()
+				names	= ()
+				left	= mask
+				for shift, t in tabs:
+					v	= mask >> shift & 0xff
+					if v:
+						n, bits	= t[v]
+						names	+= n
+						left	&= ~(bits << shift)
+				for nr, name in wide:
+					if mask & nr == nr:
+						names	+= (name,)
+						left	&= ~nr
+				return names, left
+
+			@classmethod
+			def decodes(cls, masks):
+				"""
+				decode() of many masks, returns a list
+				"""
+				seen	= {}
+				out	= []
+				for m in masks:
+					r	= seen.get(m)
+					if r is None:
+						r	= seen[m] = cls.decode(m)
+					out.append(r)
+				return out
+
+			@classmethod
+			def encode(cls, names):
+				"""
+				Mask of the given names (numbers are taken as they are)
+				"""
+				mask	= 0
+				for n in names:
+					mask	|= n if isinstance(n, int) else getattr(cls, cls._id(n))
+				return mask
+
 		self.Reg	= Reg
 		self.Fn		= Fn
+		self.Flag	= Flag
+
+		self.path, self.stamp	= _stamp(glob)
+		if self.stamp:
+			try:
+				with open(self.path) as f:
+					Reg._trusted	= f.read() == self.stamp
+			except (IOError, OSError):
+				pass
+
+	def freeze(self):
+		"""
+		Call this after everything is registered,
+		registries cannot be changed afterwards.
+		This records the source in __pycache__, such that
+		next time, as long as the source is unchanged,
+		registering skips all checks and logging.
+		Like .pyc files, nothing is written with sys.dont_write_bytecode
+		(python -B or PYTHONDONTWRITEBYTECODE).
+		"""
+		self.Reg._frozen	= True
+		if self.stamp and not self.Reg._trusted and not sys.dont_write_bytecode:
+			try:
+				tmp	= '{}.{}'.format(self.path, os.getpid())
+				with open(tmp, 'w') as f:
+					f.write(self.stamp)
+				os.rename(tmp, self.path)
+			except (IOError, OSError):
+				pass
 
@@ -9,56 +9,61 @@ _VERSION	= 3
 
 import pytino.reg
 
-_reg = pytino.reg.Registry(globals())
+_reg = pytino.reg.Registry(globals(), keeper=pytino.reg.DenseKeeper)
 
 class RWF(_reg.Reg):
 	@classmethod
-	def _reg(cls, data, read, write, fn=None):
+	def _reg(cls, data, read, write, fmt, fn=None):
 		data['read']	= read
 		data['write']	= write
+		data['fmt']	= fmt
 		data['fn']	= fn
 
+# Format of the packets (see sftp_codec.py), "name:type" each:
+#	u: uint32	q: uint64	s: string (bytes)	p: path (str)
+#	d: data (memoryview)	a: ATTRS	n: NAME entries
+#	e: extension pairs until the end	x: the rest (memoryview)
 class RX(RWF):	pass	# client
 class TX(RWF):	pass	# server
-    #  Constant		Debug			Read	Write
-RX( 0, "INIT",		'init',			False,	False,	);
-TX( 1, "VERSION",	'version',		False,	False,	);
-RX( 2, "OPEN",		'open',			True,	True,	);
-RX( 3, "CLOSE",		'close',		False,	False,	);
-RX( 4, "READ",		'read',			True,	False,	);
-RX( 5, "WRITE",		'write',		False,	True,	);
-RX( 6, "LSTAT",		'lstat',		True,	False,	);
-RX( 7, "FSTAT",		'fstat',		True,	False,	);
-RX( 8, "SETSTAT",	'setstat',		False,	False,	);
-RX( 9, "FSETSTAT",	'fsetstat',		False,	False,	);
-RX(10, "OPENDIR",	'opendir',		True,	False,	);
-RX(11, "READDIR",	'readdir',		True,	False,	);
-RX(12, "REMOVE",	'remove',		False,	True,	);
-RX(13, "MKDIR",		'mkdir',		False,	True,	);
-RX(14, "RMDIR",		'rmdir',		False,	True,	);
-RX(15, "REALPATH",	'realpath',		True,	False,	);
-RX(16, "STAT",		'stat',			True,	False,	);
-RX(17, "RENAME",	'rename',		False,	True,	);
-RX(18, "READLINK",	'readlink',		True,	False,	);
-RX(19, "SYMLINK",	'symlink',		False,	True,	);
+    #  Constant		Debug			Read	Write	Format
+RX( 1, "INIT",		'init',			False,	False,	'version:u ext:e'		);
+TX( 2, "VERSION",	'version',		False,	False,	'version:u ext:e'		);
+RX( 3, "OPEN",		'open',			True,	True,	'id:u path:p pflags:u attrs:a'	);
+RX( 4, "CLOSE",		'close',		False,	False,	'id:u handle:s'			);
+RX( 5, "READ",		'read',			True,	False,	'id:u handle:s offset:q len:u'	);
+RX( 6, "WRITE",		'write',		False,	True,	'id:u handle:s offset:q data:d'	);
+RX( 7, "LSTAT",		'lstat',		True,	False,	'id:u path:p'			);
+RX( 8, "FSTAT",		'fstat',		True,	False,	'id:u handle:s'			);
+RX( 9, "SETSTAT",	'setstat',		False,	True,	'id:u path:p attrs:a'		);
+RX(10, "FSETSTAT",	'fsetstat',		False,	True,	'id:u handle:s attrs:a'		);
+RX(11, "OPENDIR",	'opendir',		True,	False,	'id:u path:p'			);
+RX(12, "READDIR",	'readdir',		True,	False,	'id:u handle:s'			);
+RX(13, "REMOVE",	'remove',		False,	True,	'id:u path:p'			);
+RX(14, "MKDIR",		'mkdir',		False,	True,	'id:u path:p attrs:a'		);
+RX(15, "RMDIR",		'rmdir',		False,	True,	'id:u path:p'			);
+RX(16, "REALPATH",	'realpath',		True,	False,	'id:u path:p'			);
+RX(17, "STAT",		'stat',			True,	False,	'id:u path:p'			);
+RX(18, "RENAME",	'rename',		False,	True,	'id:u old:p new:p'		);
+RX(19, "READLINK",	'readlink',		True,	False,	'id:u path:p'			);
+RX(20, "SYMLINK",	'symlink',		False,	True,	'id:u target:p link:p'		);	# OpenSSH order
 
-TX(101, "STATUS",	'status',		False,	False,	);
-TX(102, "HANDLE",	'handle',		False,	False,	);
-TX(103, "DATA",		'data',			False,	False,	);
-TX(104, "NAME",		'name',			False,	False,	);
-TX(105, "ATTRS",	'attributes',		True,	False,	);
+TX(101, "STATUS",	'status',		False,	False,	'id:u code:u msg:p lang:p'	);
+TX(102, "HANDLE",	'handle',		False,	False,	'id:u handle:s'			);
+TX(103, "DATA",		'data',			False,	False,	'id:u data:d'			);
+TX(104, "NAME",		'name',			False,	False,	'id:u names:n'			);
+TX(105, "ATTRS",	'attributes',		True,	False,	'id:u attrs:a'			);
       
-TX(200, "EXT",		'extended',		False,	False,	);
-TX(201, "EXT_REPLY",	'extended_reply',	False,	False,	);
+TX(200, "EXT",		'extended',		False,	False,	'id:u request:p data:x'		);
+TX(201, "EXT_REPLY",	'extended_reply',	False,	False,	'id:u data:x'			);
 
-class AT(_reg.Reg):	pass
+class AT(_reg.Flag):	pass
 AT(0x00000001,	"SIZE",		);
 AT(0x00000002,	"UIDGID",	);
 AT(0x00000004,	"PERM",		);
 AT(0x00000008,	"ACM_TIME",	);
 AT(0x80000000,	"EXT",		);
 
-class MO(_reg.Reg):	pass
+class MO(_reg.Flag):	pass
 MO(0x00000001,	"READ",		);
 MO(0x00000002,	"WRITE",	);
 MO(0x00000004,	"APPEND",	);
@@ -67,7 +72,7 @@ MO(0x00000010,	"TRUNC",	);
 MO(0x00000020,	"EXCL",		);
 
 ## statvfs@openssh.com f_flag flags */
-class EXT(_reg.Reg):	pass
+class EXT(_reg.Flag):	pass
 EXT(0x00000001,	"Xstatvfs_RDONLY",	);
 EXT(0x00000002,	"Xstatvfs_NOSUID",	);
 
@@ -82,3 +87,4 @@ RET(6, "NO_CONNECTION",		'No connection',		);
 RET(7, "CONNECTION_LOST",	'Connection lost',		);
 RET(8, "OP_UNSUPPORTED",	'Operation unsupported',	);
 
+_reg.freeze()
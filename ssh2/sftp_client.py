@@ -0,0 +1,524 @@
+# Pipelined asyncio SFTP v3 client
+#
+# vim:set ts=8:
+#
+# This Works is placed under the terms of the Copyright Less License,
+# see file COPYRIGHT.CLL.  USE AT OWN RISK, ABSOLUTELY NO WARRANTY.
+#
+# Usage:
+#	c	= await Client.spawn('ssh', '-s', 'host', 'sftp')	# or: spawn('/usr/lib/openssh/sftp-server')
+#	c	= await Client.connect(reader, writer)			# any asyncio stream pair
+#	async with await c.open('file', 'r') as f:
+#		data	= await f.read()
+#	await c.get('remote', 'local')
+#	await c.close()
+#
+# Many requests are kept outstanding and replies are matched by request id.
+# The number of outstanding READ/WRITE requests of a file adapts to the latency, see Window.
+
+from __future__ import absolute_import
+
+import errno
+import asyncio
+import posixpath
+import itertools
+import collections
+
+import pytino.log as log
+import pytino.ssh2.sftp as sftp
+import pytino.ssh2.sftp_codec as codec
+
+RX, TX, MO, RET	= sftp.RX, sftp.TX, sftp.MO, sftp.RET
+
+BLOCK	= 32768		# bytes per READ/WRITE request, which all servers support
+
+_ERRNO	= {
+	RET.EOF:		errno.ENODATA,
+	RET.NO_SUCH_FILE:	errno.ENOENT,
+	RET.PERMISSION_DENIED:	errno.EACCES,
+	RET.FAILURE:		errno.EIO,
+	RET.BAD_MESSAGE:	errno.EBADMSG,
+	RET.NO_CONNECTION:	errno.ENOTCONN,
+	RET.CONNECTION_LOST:	errno.ECONNRESET,
+	RET.OP_UNSUPPORTED:	errno.EOPNOTSUPP,
+	}
+
+_MODES	= {
+	'r':	MO.encode(['READ']),
+	'w':	MO.encode(['WRITE', 'CREAT', 'TRUNC']),
+	'a':	MO.encode(['WRITE', 'APPEND', 'CREAT']),
+	'x':	MO.encode(['WRITE', 'CREAT', 'EXCL']),
+	}
+
+
+class Error(OSError):
+	'''
+	SFTP STATUS as OSError, .code is the RET number
+	'''
+	def __init__(self, code, msg=None, path=None):
+		r	= RET.get(code)
+		OSError.__init__(self, _ERRNO.get(code, errno.EIO), msg or (r.info if r else 'SFTP error {}'.format(code)), path)
+		self.code	= code
+
+
+def mode(m):
+	'''
+	SFTP open flags of a mode like 'r', 'w', 'a', 'x' and '+', or the flags
+	'''
+	if isinstance(m, int):
+		return m
+	f	= _MODES[m.replace('b', '').replace('+', '')[:1]]
+	if '+' in m:
+		f	|= MO.READ | MO.WRITE
+	return f
+
+
+class Window(object):
+	'''
+	Number of outstanding requests, adapted to the latency:
+	While the round trip time stays near the fastest seen,
+	the link is not saturated, so the window grows.
+	If requests queue up (rtt above twice the fastest),
+	the window shrinks by a quarter.
+	'''
+	def __init__(self, size=8, min=1, max=64):
+		self.size	= float(size)
+		self.min	= min
+		self.max	= max
+		self.busy	= 0
+		self.base	= None	# fastest rtt
+		self.rtt	= None	# smoothed rtt
+		self.waiting	= collections.deque()
+
+	async def acquire(self):
+		while self.busy >= int(self.size):
+			f	= asyncio.get_event_loop().create_future()
+			self.waiting.append(f)
+			await f
+		self.busy	+= 1
+
+	def release(self, rtt=None):
+		self.busy	-= 1
+		if rtt is not None:
+			self.base	= rtt if self.base is None or rtt < self.base else self.base
+			self.rtt	= rtt if self.rtt is None else self.rtt * 0.875 + rtt * 0.125
+			if self.rtt < self.base * 1.25:
+				self.size	= min(self.max, self.size + 1)
+			elif self.rtt > self.base * 2:
+				self.size	= max(self.min, self.size * 0.75)
+		n	= int(self.size) - self.busy
+		while n > 0 and self.waiting:
+			f	= self.waiting.popleft()
+			if not f.done():
+				f.set_result(None)
+				n	-= 1
+
+
+class File(object):
+	'''
+	Remote file of Client.open()
+	'''
+	def __init__(self, client, handle, path, block=BLOCK, window=None):
+		self.client	= client
+		self.handle	= handle
+		self.path	= path
+		self.block	= block
+		self.window	= window or Window()
+		self.pos	= 0
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		await self.close()
+
+	async def close(self):
+		if self.handle is not None:
+			h, self.handle	= self.handle, None
+			await self.client._status(RX.CLOSE, h)
+
+	def seek(self, pos, whence=0):
+		if whence == 1:
+			pos	+= self.pos
+		elif whence == 2:
+			raise ValueError('sftp: seek from end needs stat(), use seek(await f.size())')
+		self.pos	= pos
+		return pos
+
+	def tell(self):
+		return self.pos
+
+	async def stat(self):
+		return (await self.client.request(RX.FSTAT, self.handle)).attrs
+
+	async def size(self):
+		return (await self.stat()).size
+
+	async def setstat(self, attrs):
+		await self.client._status(RX.FSETSTAT, self.handle, attrs)
+
+	async def truncate(self, size):
+		await self.setstat(codec.Attrs(size=size))
+
+	async def _read(self, offset, n):
+		# needs an acquired window
+		w	= self.window
+		loop	= asyncio.get_event_loop()
+		t	= loop.time()
+		try:
+			p	= await self.client.request(RX.READ, self.handle, offset, n)
+		except Error as e:
+			if e.code != RET.EOF:
+				w.release()
+				raise
+			p	= None
+		except BaseException:
+			w.release()
+			raise
+		w.release(loop.time() - t)
+		return p.data if p else b''
+
+	async def _write(self, offset, data):
+		# needs an acquired window
+		w	= self.window
+		loop	= asyncio.get_event_loop()
+		t	= loop.time()
+		try:
+			await self.client._status(RX.WRITE, self.handle, offset, data)
+		except BaseException:
+			w.release()
+			raise
+		w.release(loop.time() - t)
+
+	async def pread(self, offset, n):
+		'''
+		One READ request, returns b'' at EOF.
+		Might return less than n.
+		'''
+		await self.window.acquire()
+		return await self._read(offset, n)
+
+	async def pwrite(self, offset, data):
+		'''
+		One WRITE request
+		'''
+		await self.window.acquire()
+		await self._write(offset, data)
+
+	async def _readfull(self, offset, n):
+		# Servers may return less, so read the rest
+		d	= await self.pread(offset, n)
+		if 0 < len(d) < n:
+			parts	= [d]
+			got	= len(d)
+			while got < n:
+				d	= await self.pread(offset + got, n - got)
+				if not d:
+					break
+				parts.append(d)
+				got	+= len(d)
+			d	= b''.join(parts)
+		return d
+
+	async def blocks(self, offset=0, end=None, block=None):
+		'''
+		Async generator of ( offset, data ) up to end (or EOF),
+		in order, keeping the window of READs outstanding.
+		'''
+		block	= block or self.block
+		w	= self.window
+		loop	= asyncio.get_event_loop()
+		todo	= collections.deque()
+		eof	= False
+		try:
+			while True:
+				while not eof and (end is None or offset < end) and len(todo) < max(1, int(w.size)):
+					n	= block if end is None else min(block, end - offset)
+					todo.append((offset, n, loop.create_task(self._readfull(offset, n))))
+					offset	+= n
+				if not todo:
+					break
+				o, n, t	= todo.popleft()
+				d	= await t
+				if not d:
+					break
+				yield o, d
+				if len(d) < n:
+					eof	= True
+		finally:
+			for o, n, t in todo:
+				t.cancel()
+
+	async def _writes(self, chunks):
+		# WRITE ( offset, data ) chunks within the window
+		loop	= asyncio.get_event_loop()
+		tasks	= set()
+		try:
+			for off, d in chunks:
+				while len(tasks) >= max(1, int(self.window.size)):
+					done, tasks	= await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+					err	= [t.exception() for t in done]
+					for e in err:
+						if e is not None:
+							raise e		# errors early
+				tasks.add(loop.create_task(self.pwrite(off, d)))
+			await asyncio.gather(*tasks)
+		except BaseException:
+			for t in tasks:
+				t.cancel()
+			if tasks:
+				await asyncio.wait(tasks)
+				for t in tasks:
+					if not t.cancelled():
+						t.exception()	# retrieved
+			raise
+
+	async def read(self, n=-1):
+		'''
+		Read n bytes (or everything) from the current position
+		'''
+		if n == 0:
+			return b''
+		parts	= []
+		async for o, d in self.blocks(self.pos, None if n is None or n < 0 else self.pos + n):
+			parts.append(d)
+		d	= b''.join(parts)
+		self.pos	+= len(d)
+		return d
+
+	async def write(self, data, offset=None):
+		'''
+		Write data at the current position (or offset), pipelined
+		'''
+		if offset is None:
+			offset	= self.pos
+		v	= memoryview(data).cast('B')
+		await self._writes((offset + i, v[i:i+self.block]) for i in range(0, len(v), self.block))
+		self.pos	= offset + len(v)
+		return len(v)
+
+
+class Client(object):
+	'''
+	SFTP v3 client over an asyncio stream pair, see top of file
+	'''
+	def __init__(self, reader, writer, proc=None):
+		self.reader	= reader
+		self.writer	= writer
+		self.proc	= proc
+		self.pending	= {}
+		self.ids	= itertools.count(1)
+		self.decoder	= codec.Decoder()
+		self.version	= None
+		self.ext	= {}
+		self.task	= None
+
+	@classmethod
+	async def connect(cls, reader, writer, proc=None):
+		c	= cls(reader, writer, proc)
+		await c._init()
+		return c
+
+	@classmethod
+	async def spawn(cls, *cmd):
+		'''
+		Run cmd (like: ssh -s host sftp) and talk to it via stdin/stdout
+		'''
+		p	= await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+		return await cls.connect(p.stdout, p.stdin, p)
+
+	async def _init(self):
+		self.writer.writelines(codec.encode(RX.INIT, sftp._VERSION, None))
+		while True:
+			d	= await self.reader.read(65536)
+			if not d:
+				raise Error(RET.CONNECTION_LOST)
+			self.decoder.feed(d)
+			for p in self.decoder:
+				if p.type != TX.VERSION:
+					raise Error(RET.BAD_MESSAGE, 'sftp: VERSION expected')
+				self.version	= p.version
+				self.ext	= dict(p.ext or ())
+				log.debug('sftp version', p.version, *sorted(self.ext))
+				self.task	= asyncio.get_event_loop().create_task(self._run())
+				return
+
+	async def _run(self):
+		err	= Error(RET.CONNECTION_LOST)
+		try:
+			while True:
+				d	= await self.reader.read(1<<18)
+				if not d:
+					break
+				self.decoder.feed(d)
+				for p in self.decoder:
+					f	= self.pending.pop(p.id, None)
+					if f is not None and not f.done():
+						f.set_result(p)
+		except Exception as e:
+			err	= e
+		finally:
+			self.task	= None
+			p, self.pending	= self.pending, {}
+			for f in p.values():
+				if not f.done():
+					f.set_exception(err)
+
+	async def request(self, nr, *fields):
+		'''
+		Send a request and return the reply.
+		STATUS other than OK raises Error.
+		'''
+		if self.task is None:
+			raise Error(RET.NO_CONNECTION)
+		id	= next(self.ids) & 0xffffffff
+		f	= asyncio.get_event_loop().create_future()
+		self.pending[id]	= f
+		self.writer.writelines(codec.encode(nr, id, *fields))
+		if self.writer.transport.get_write_buffer_size() > 1<<20:
+			await self.writer.drain()
+		p	= await f
+		if p.type == TX.STATUS and p.code != RET.OK:
+			raise Error(p.code, p.msg, fields and isinstance(fields[0], str) and fields[0] or None)
+		return p
+
+	async def _status(self, nr, *fields):
+		p	= await self.request(nr, *fields)
+		if p.type != TX.STATUS:
+			raise Error(RET.BAD_MESSAGE, 'sftp: STATUS expected')
+
+	async def close(self):
+		self.writer.close()
+		if self.task:
+			self.task.cancel()
+		if self.proc:
+			await self.proc.wait()
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *args):
+		await self.close()
+
+	async def open(self, path, m='r', attrs=None, block=BLOCK, window=None):
+		p	= await self.request(RX.OPEN, path, mode(m), attrs)
+		f	= File(self, p.handle, path, block, window)
+		if 'a' in str(m):
+			f.pos	= await f.size()
+		return f
+
+	async def stat(self, path):
+		return (await self.request(RX.STAT, path)).attrs
+
+	async def lstat(self, path):
+		return (await self.request(RX.LSTAT, path)).attrs
+
+	async def setstat(self, path, attrs):
+		await self._status(RX.SETSTAT, path, attrs)
+
+	async def remove(self, path):
+		await self._status(RX.REMOVE, path)
+
+	async def mkdir(self, path, attrs=None):
+		await self._status(RX.MKDIR, path, attrs)
+
+	async def rmdir(self, path):
+		await self._status(RX.RMDIR, path)
+
+	async def rename(self, old, new):
+		await self._status(RX.RENAME, old, new)
+
+	async def symlink(self, target, link):
+		await self._status(RX.SYMLINK, target, link)
+
+	async def readlink(self, path):
+		return (await self.request(RX.READLINK, path)).names[0].filename
+
+	async def realpath(self, path):
+		return (await self.request(RX.REALPATH, path)).names[0].filename
+
+	async def scandir(self, path):
+		'''
+		List of codec.Name of a directory (without . and ..)
+		'''
+		h	= (await self.request(RX.OPENDIR, path)).handle
+		names	= []
+		try:
+			while True:
+				try:
+					p	= await self.request(RX.READDIR, h)
+				except Error as e:
+					if e.code == RET.EOF:
+						break
+					raise
+				names.extend(n for n in p.names if n.filename not in ('.', '..'))
+		finally:
+			await self._status(RX.CLOSE, h)
+		return names
+
+	async def listdir(self, path):
+		return [n.filename for n in await self.scandir(path)]
+
+	async def walk(self, top='.', parallel=16, onerror=None):
+		'''
+		Like os.walk(), async generator of ( dirpath, dirs, files ),
+		with lists of codec.Name, their attrs are those of READDIR.
+		Up to parallel directories are listed at once, results come as
+		they complete.  Remove entries from dirs to not descend into them.
+		Symlinks are files, as the attrs are like lstat().
+		'''
+		loop	= asyncio.get_event_loop()
+		todo	= collections.deque([top])
+		running	= {}
+		try:
+			while todo or running:
+				while todo and len(running) < parallel:
+					p	= todo.popleft()
+					running[loop.create_task(self.scandir(p))]	= p
+				done, _	= await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+				for t in done:
+					p	= running.pop(t)
+					try:
+						names	= t.result()
+					except Error as e:
+						if onerror is not None:
+							e.filename	= e.filename or p
+							onerror(e)
+						continue
+					dirs, files	= [], []
+					for n in names:
+						if n.attrs.perm is None:	# server did not send AT.PERM
+							n	= n._replace(attrs=await self.lstat(posixpath.join(p, n.filename)))
+						(dirs if n.attrs.isdir() else files).append(n)
+					yield p, dirs, files
+					todo.extend(posixpath.join(p, n.filename) for n in dirs)
+		finally:
+			for t in running:
+				t.cancel()
+
+	async def get(self, remote, local, block=BLOCK):
+		'''
+		Copy remote file to local file
+		'''
+		async with await self.open(remote, 'r', block=block) as f:
+			with open(local, 'wb') as o:
+				async for off, d in f.blocks():
+					o.write(d)
+
+	async def put(self, local, remote, block=BLOCK):
+		'''
+		Copy local file to remote file
+		'''
+		async with await self.open(remote, 'w', block=block) as f:
+			with open(local, 'rb') as i:
+				await f._writes(_chunks(i, block))
+
+
+def _chunks(f, block):
+	off	= 0
+	while True:
+		d	= f.read(block)
+		if not d:
+			return
+		yield off, d
+		off	+= len(d)
@@ -0,0 +1,343 @@
+# SFTP v3 packet codec, driven by the formats in sftp.py
+#
+# vim:set ts=8:
+#
+# This Works is placed under the terms of the Copyright Less License,
+# see file COPYRIGHT.CLL.  USE AT OWN RISK, ABSOLUTELY NO WARRANTY.
+#
+# see https://datatracker.ietf.org/doc/html/draft-ietf-secsh-filexfer-02
+#
+# Decoding:
+#	d	= Decoder()
+#	d.feed(data)		# any chunks of the byte stream
+#	for p in d:		# complete packets, like READ(type=4, id=.., handle=.., offset=.., len=..)
+#		..
+# DATA and WRITE payloads are memoryviews into the received data, they are not copied.
+# With asyncio.BufferedProtocol use d.get_buffer() and d.buffer_updated() instead of feed(),
+# then large payloads are received directly into their own buffer.
+#
+# Encoding:
+#	bufs	= encode(RX.WRITE, id, handle, offset, data)
+#	transport.writelines(bufs)	# or os.writev(), data is not copied
+
+from __future__ import absolute_import
+
+import stat
+import struct
+import collections
+
+import pytino.ssh2.sftp as sftp
+
+_U32	= struct.Struct('>I')
+_U64	= struct.Struct('>Q')
+
+LIMIT	= (256 + 16) * 1024		# default maximum packet size
+
+
+class Attrs(collections.namedtuple('Attrs', 'size uid gid perm atime mtime ext')):
+	'''
+	SFTP ATTRS, None means not present
+	'''
+	__slots__	= ()
+
+	@classmethod
+	def fromstat(cls, st):
+		return cls(st.st_size, st.st_uid, st.st_gid, st.st_mode, int(st.st_atime), int(st.st_mtime), None)
+
+	def isdir(self):
+		return self.perm is not None and stat.S_ISDIR(self.perm)
+
+	def islnk(self):
+		return self.perm is not None and stat.S_ISLNK(self.perm)
+
+	def isreg(self):
+		return self.perm is not None and stat.S_ISREG(self.perm)
+
+Attrs.__new__.__defaults__	= (None,) * len(Attrs._fields)
+NOATTRS	= Attrs()
+
+Name	= collections.namedtuple('Name', 'filename longname attrs')
+
+
+def _str(b, i):
+	n	= _U32.unpack_from(b, i)[0]
+	i	+= 4
+	if i + n > len(b):
+		raise ValueError('sftp: string beyond packet end')
+	return b[i:i+n], i + n
+
+def _attrs(b, i):
+	f	= _U32.unpack_from(b, i)[0]
+	i	+= 4
+	size = uid = gid = perm = atime = mtime = ext = None
+	if f & sftp.AT.SIZE:
+		size	= _U64.unpack_from(b, i)[0]
+		i	+= 8
+	if f & sftp.AT.UIDGID:
+		uid, gid	= struct.unpack_from('>II', b, i)
+		i	+= 8
+	if f & sftp.AT.PERM:
+		perm	= _U32.unpack_from(b, i)[0]
+		i	+= 4
+	if f & sftp.AT.ACM_TIME:
+		atime, mtime	= struct.unpack_from('>II', b, i)
+		i	+= 8
+	if f & sftp.AT.EXT:
+		n	= _U32.unpack_from(b, i)[0]
+		i	+= 4
+		ext	= []
+		for _ in range(n):
+			k, i	= _str(b, i)
+			v, i	= _str(b, i)
+			ext.append((bytes(k), bytes(v)))
+	return Attrs(size, uid, gid, perm, atime, mtime, ext), i
+
+def _path(b):
+	return bytes(b).decode('utf-8', 'surrogateescape')
+
+def _u(b, i):	return _U32.unpack_from(b, i)[0], i + 4
+def _q(b, i):	return _U64.unpack_from(b, i)[0], i + 8
+def _s(b, i):
+	s, i	= _str(b, i)
+	return bytes(s), i
+def _p(b, i):
+	s, i	= _str(b, i)
+	return _path(s), i
+def _d(b, i):	return _str(b, i)
+def _x(b, i):	return b[i:], len(b)
+def _e(b, i):
+	ext	= []
+	while i < len(b):
+		k, i	= _str(b, i)
+		v, i	= _str(b, i)
+		ext.append((_path(k), bytes(v)))
+	return ext, i
+def _n(b, i):
+	n	= _U32.unpack_from(b, i)[0]
+	i	+= 4
+	names	= []
+	for _ in range(n):
+		f, i	= _p(b, i)
+		l, i	= _p(b, i)
+		a, i	= _attrs(b, i)
+		names.append(Name(f, l, a))
+	return names, i
+
+_DECODE	= { 'u':_u, 'q':_q, 's':_s, 'p':_p, 'd':_d, 'x':_x, 'e':_e, 'n':_n, 'a':_attrs }
+
+
+def _bstr(s):
+	if isinstance(s, str):
+		s	= s.encode('utf-8', 'surrogateescape')
+	return _U32.pack(len(s)) + s
+
+def _battrs(a):
+	if a is None:
+		return b'\0\0\0\0'
+	f	= 0
+	o	= []
+	if a.size is not None:
+		f	|= sftp.AT.SIZE
+		o.append(_U64.pack(a.size))
+	if a.uid is not None:
+		f	|= sftp.AT.UIDGID
+		o.append(struct.pack('>II', a.uid, a.gid))
+	if a.perm is not None:
+		f	|= sftp.AT.PERM
+		o.append(_U32.pack(a.perm))
+	if a.atime is not None:
+		f	|= sftp.AT.ACM_TIME
+		o.append(struct.pack('>II', a.atime, a.mtime))
+	if a.ext:
+		f	|= sftp.AT.EXT
+		o.append(_U32.pack(len(a.ext)))
+		for k, v in a.ext:
+			o.append(_bstr(k) + _bstr(v))
+	return _U32.pack(f) + b''.join(o)
+
+def _bnames(names):
+	o	= [_U32.pack(len(names))]
+	for n in names:
+		o.append(_bstr(n[0]) + _bstr(n[1]) + _battrs(n[2]))
+	return b''.join(o)
+
+def _bext(ext):
+	return b''.join(_bstr(k) + _bstr(v) for k, v in ext or ())
+
+_ENCODE	= { 'u':_U32.pack, 'q':_U64.pack, 's':_bstr, 'p':_bstr, 'a':_battrs, 'n':_bnames, 'e':_bext }
+
+
+# type -> ( namedtuple, [ decoders ], [ field types ] )
+_TYPES	= [None] * 256
+
+for _r in (sftp.RX, sftp.TX):
+	for _nr, _t in _r._keep.items():
+		_f	= [f.split(':') for f in _t['fmt'].split()]
+		_TYPES[_nr]	= ( collections.namedtuple(_t['name'], ['type'] + [f[0] for f in _f]), [_DECODE[f[1]] for f in _f], [f[1] for f in _f] )
+del _r, _nr, _t, _f
+
+
+def decode(b):
+	'''
+	Decode one packet without the length (type and fields).
+	b should be a memoryview, as slices of it are returned.
+	Missing fields at the end are None.
+	'''
+	t	= _TYPES[b[0]]
+	if t is None:
+		raise ValueError('sftp: unknown packet type {}'.format(b[0]))
+	i	= 1
+	n	= len(b)
+	v	= [b[0]]
+	try:
+		for d in t[1]:
+			if i >= n:
+				v.append(None)
+				continue
+			x, i	= d(b, i)
+			v.append(x)
+	except (struct.error, ValueError) as e:
+		raise BadMessage(b, e)
+	return t[0]._make(v)
+
+
+class BadMessage(ValueError):
+	'''
+	Packet with broken fields, id is its request id if known
+	'''
+	def __init__(self, b, e):
+		ValueError.__init__(self, 'sftp: bad packet type {}: {}'.format(b[0], e))
+		self.id	= _U32.unpack_from(b, 1)[0] if len(b) >= 5 and b[0] not in (sftp.RX.INIT, sftp.TX.VERSION) else None
+
+
+def encode(nr, *fields):
+	'''
+	Encode a packet as a list of buffers for writelines() or os.writev().
+	Data (d) and the rest (x) are not copied.
+	'''
+	t	= _TYPES[nr]
+	if t is None:
+		raise ValueError('sftp: unknown packet type {}'.format(nr))
+	if len(fields) != len(t[2]):
+		raise TypeError('sftp: {} needs {} fields'.format(t[0].__name__, len(t[2])))
+	head	= [struct.pack('B', nr)]
+	bufs	= [None]
+	size	= 0
+	for k, v in zip(t[2], fields):
+		if k == 'd' or k == 'x':
+			n	= memoryview(v).nbytes
+			if k == 'd':
+				head.append(_U32.pack(n))
+			h	= b''.join(head)
+			bufs.append(h)
+			bufs.append(v)
+			size	+= len(h) + n
+			head	= []
+		else:
+			head.append(_ENCODE[k](v))
+	if head:
+		h	= b''.join(head)
+		bufs.append(h)
+		size	+= len(h)
+	bufs[0]	= _U32.pack(size)
+	if len(bufs) == 2:
+		return [bufs[0] + bufs[1]]
+	return bufs
+
+
+def packet(nr, *fields):
+	'''
+	Like encode(), but a single bytes (copies)
+	'''
+	return b''.join(encode(nr, *fields))
+
+
+class Decoder(object):
+	'''
+	Incremental decoder of a SFTP byte stream,
+	see the top of this file.
+	'''
+	stage	= 65536		# size of the receive buffer of get_buffer()
+	direct	= 4096		# receive bodies at least this large directly
+
+	def __init__(self, limit=LIMIT):
+		self.limit	= limit
+		self.out	= collections.deque()
+		self.head	= bytearray(4)
+		self.body	= None
+		self.pos	= 0
+		self.buf	= None
+		self.into	= False
+
+	def __iter__(self):
+		out	= self.out
+		while out:
+			yield out.popleft()
+
+	def __len__(self):
+		return len(self.out)
+
+	def feed(self, data):
+		'''
+		Feed received data.  Packets completely within bytes data
+		are not copied, they refer to data.
+		'''
+		self._consume(memoryview(data).cast('B'), isinstance(data, bytes))
+
+	def get_buffer(self, hint=-1):
+		if self.body is not None and len(self.body) - self.pos >= self.direct:
+			self.into	= True
+			return memoryview(self.body)[self.pos:]
+		if self.buf is None:
+			self.buf	= bytearray(self.stage)
+		self.into	= False
+		return memoryview(self.buf)
+
+	def buffer_updated(self, n):
+		if self.into:
+			self.pos	+= n
+			if self.pos == len(self.body):
+				self._done()
+		else:
+			self._consume(memoryview(self.buf)[:n], False)
+
+	def _length(self, n):
+		if n < 1 or n > self.limit:
+			raise ValueError('sftp: bad packet length {}'.format(n))
+		return n
+
+	def _done(self):
+		b, self.body	= self.body, None
+		self.pos	= 0
+		self.out.append(decode(memoryview(b)))
+
+	def _consume(self, mv, keep):
+		i	= 0
+		n	= len(mv)
+		while i < n:
+			if self.body is not None:
+				k	= min(n - i, len(self.body) - self.pos)
+				self.body[self.pos:self.pos+k]	= mv[i:i+k]
+				self.pos	+= k
+				i		+= k
+				if self.pos == len(self.body):
+					self._done()
+				continue
+			if self.pos or n - i < 4:
+				k	= min(4 - self.pos, n - i)
+				self.head[self.pos:self.pos+k]	= mv[i:i+k]
+				self.pos	+= k
+				i		+= k
+				if self.pos == 4:
+					self.body	= bytearray(self._length(_U32.unpack(self.head)[0]))
+					self.pos	= 0
+				continue
+			l	= self._length(_U32.unpack_from(mv, i)[0])
+			i	+= 4
+			if n - i >= l:
+				b	= mv[i:i+l]
+				self.out.append(decode(b if keep else memoryview(bytes(b))))
+				i	+= l
+				continue
+			self.body	= bytearray(l)
+			self.pos	= 0
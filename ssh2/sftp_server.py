@@ -0,0 +1,675 @@
+# asyncio SFTP v3 server engine, serving a local directory tree
+#
+# vim:set ts=8:
+#
+# This Works is placed under the terms of the Copyright Less License,
+# see file COPYRIGHT.CLL.  USE AT OWN RISK, ABSOLUTELY NO WARRANTY.
+#
+# Usage:
+#	python3 -m pytino.ssh2.sftp_server [-r] dir		# stdin/stdout, try: sftp -D 'python3 -m pytino.ssh2.sftp_server dir'
+#	python3 -m pytino.ssh2.sftp_server [-r] dir host:port	# or a socket path
+#
+#	s	= Server('dir', readonly=True)
+#	await s.serve(reader, writer)		# one session on any asyncio stream pair
+#	srv	= await s.listen('/tmp/sock')	# or ('host', port), returns the asyncio.Server
+#
+# Requests are processed concurrently, replies go out in completion order.
+# The RX flags (see sftp.py) decide:
+#	write:	refused with PERMISSION_DENIED in readonly mode (OPEN only if it asks to modify)
+#	read/write:	the per type concurrency limit, see Server.limits
+# Blocking calls run in a bounded thread pool.  READ replies are sent with
+# os.sendfile() on sockets, else with os.pread() (or mmap(), see Server.mmap).
+# Consecutive WRITEs to a handle are collected into one os.pwritev().
+#
+# Paths are relative to the directory and walked component by component
+# (dir_fd, O_NOFOLLOW), so neither "..", symlinks nor concurrent renames leave it.
+
+from __future__ import absolute_import
+
+import os
+import sys
+import stat
+import mmap
+import time
+import errno
+import socket
+import asyncio
+import itertools
+import collections
+import concurrent.futures
+
+import pytino.log as log
+import pytino.ssh2.sftp as sftp
+import pytino.ssh2.sftp_codec as codec
+
+RX, TX, MO, RET	= sftp.RX, sftp.TX, sftp.MO, sftp.RET
+
+_RET	= {
+	errno.ENOENT:		RET.NO_SUCH_FILE,
+	errno.ENOTDIR:		RET.NO_SUCH_FILE,
+	errno.EACCES:		RET.PERMISSION_DENIED,
+	errno.EPERM:		RET.PERMISSION_DENIED,
+	errno.EROFS:		RET.PERMISSION_DENIED,
+	errno.EOPNOTSUPP:	RET.OP_UNSUPPORTED,
+	errno.ENOSYS:		RET.OP_UNSUPPORTED,
+	}
+
+_FLAGS	= [
+	(MO.APPEND,	os.O_APPEND),
+	(MO.CREAT,	os.O_CREAT),
+	(MO.TRUNC,	os.O_TRUNC),
+	(MO.EXCL,	os.O_EXCL),
+	]
+
+_MODIFY	= MO.WRITE | MO.APPEND | MO.CREAT | MO.TRUNC
+_PATH	= getattr(os, 'O_PATH', os.O_RDONLY)
+_CLOEXEC	= getattr(os, 'O_CLOEXEC', 0)
+
+
+class Fail(Exception):
+	'''
+	Reply with STATUS code
+	'''
+	def __init__(self, code, msg=None):
+		Exception.__init__(self, msg or RET.get(code).info)
+		self.code	= code
+
+
+def _status(e):
+	'''
+	( RET code, message ) of an exception
+	'''
+	if isinstance(e, Fail):
+		return e.code, str(e)
+	if isinstance(e, OSError):
+		return _RET.get(e.errno, RET.FAILURE), e.strerror or str(e)
+	return RET.FAILURE, str(e)
+
+
+def longname(name, st):
+	'''
+	The "ls -l" line of NAME entries
+	'''
+	return '%s %3d %-8d %-8d %8d %s %s' % (stat.filemode(st.st_mode), st.st_nlink, st.st_uid, st.st_gid, st.st_size,
+		time.strftime('%b %d %H:%M' if time.time() - st.st_mtime < 15552000 else '%b %d  %Y', time.localtime(st.st_mtime)), name)
+
+
+class Handle(object):
+	'''
+	Open file or directory of a session
+	'''
+	__slots__	= ('fd', 'path', 'dir', 'ro', 'rd', 'mm', 'fo', 'writes', 'flusher', 'busy', 'idle')
+
+	def __init__(self, fd, path, dir=None, ro=False, rd=False):
+		self.fd		= fd
+		self.path	= path
+		self.dir	= dir		# os.scandir() iterator
+		self.ro		= ro		# opened read only
+		self.rd		= rd		# opened with READ
+		self.mm		= None		# mmap for READ, False if not used
+		self.fo		= None		# file object for loop.sendfile()
+		self.writes	= []		# ( offset, data, id, Future ) not yet written
+		self.flusher	= None
+		self.busy	= 0		# requests in progress
+		self.idle	= None		# Future of close() waiting for busy
+
+	def close(self):
+		if self.dir is not None:
+			self.dir.close()
+		if self.mm:
+			try:
+				self.mm.close()
+			except BufferError:
+				pass			# still exported to a transport buffer, GC closes it
+		if self.fo is not None:
+			self.fo.close()
+		if self.fd is not None:
+			os.close(self.fd)
+		self.fd	= self.mm = self.fo = self.dir = None
+
+
+class Session(object):
+	'''
+	One client connection
+	'''
+	def __init__(self, server, reader, writer):
+		self.server	= server
+		self.reader	= reader
+		self.writer	= writer
+		self.loop	= asyncio.get_event_loop()
+		self.handles	= {}
+		self.nr		= itertools.count(1)
+		self.tasks	= set()
+		self.lock	= None
+		self.decoder	= codec.Decoder()
+		self.limits	= dict((nr, asyncio.Semaphore(n)) for nr, n in server._limits.items())
+		sock		= writer.get_extra_info('socket')
+		if server.sendfile and sock is not None and sock.type == socket.SOCK_STREAM:
+			self.lock	= asyncio.Lock()	# nothing may be written while loop.sendfile() runs
+
+	def run(self, fn, *args):
+		return self.loop.run_in_executor(self.server.pool, fn, *args)
+
+	async def send(self, bufs):
+		if self.lock is None:
+			self.writer.writelines(bufs)
+		else:
+			async with self.lock:
+				self.writer.writelines(bufs)
+		await self.writer.drain()
+
+	def reply(self, nr, *fields):
+		return self.send(codec.encode(nr, *fields))
+
+	def status(self, id, code, msg=None):
+		return self.reply(TX.STATUS, id, code, msg or RET.get(code).info, '')
+
+	async def main(self):
+		p	= None
+		try:
+			while True:
+				d	= await self.reader.read(1<<18)
+				if not d:
+					break
+				self.decoder.feed(d)
+				for p in self.decoder:
+					if p.type == RX.INIT:
+						await self.reply(TX.VERSION, sftp._VERSION, [])
+						continue
+					while len(self.tasks) >= self.server.queue:
+						await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+					t	= asyncio.ensure_future(self.request(p))
+					self.tasks.add(t)
+					t.add_done_callback(self.tasks.discard)
+			if self.tasks:
+				await asyncio.wait(self.tasks)
+		except codec.BadMessage as e:
+			log.info('sftp: session ends', e, p)
+			if e.id is not None:
+				try:
+					await self.status(e.id, RET.BAD_MESSAGE)
+				except ConnectionError:
+					pass
+		except (ConnectionError, ValueError) as e:
+			log.info('sftp: session ends', e, p)
+		finally:
+			for t in list(self.tasks):
+				t.cancel()
+			for h in self.handles.values():
+				h.close()
+			self.handles	= {}
+			try:
+				self.writer.close()
+			except Exception:
+				pass
+
+	async def request(self, p):
+		id	= getattr(p, 'id', None)
+		if id is None:
+			return
+		op	= self.server._ops[p.type]
+		if op is None:
+			return await self.status(id, RET.OP_UNSUPPORTED)
+		try:
+			if self.server.readonly and self.server._modifies[p.type] and (p.type != RX.OPEN or p.pflags & _MODIFY):
+				raise Fail(RET.PERMISSION_DENIED, 'read only')
+			async with self.limits[p.type]:
+				await op(self, p)
+		except asyncio.CancelledError:
+			raise
+		except ConnectionError:
+			pass				# main() sees it, too
+		except Exception as e:
+			code, msg	= _status(e)
+			if code == RET.FAILURE and not isinstance(e, OSError):
+				log.err('sftp: request failed', p, exc_info=True)
+			await self.status(id, code, msg)
+
+	# handles
+
+	def add(self, h):
+		k	= str(next(self.nr)).encode()
+		self.handles[k]	= h
+		return k
+
+	def handle(self, p, dir=False):
+		h	= self.handles.get(p.handle)
+		if h is None or (h.dir is not None) != dir:
+			raise Fail(RET.FAILURE, 'invalid handle')
+		return h
+
+	async def using(self, h, aw):
+		'''
+		Await aw, but keep CLOSE of h waiting meanwhile
+		'''
+		h.busy	+= 1
+		try:
+			return await aw
+		finally:
+			h.busy	-= 1
+			if not h.busy and h.idle is not None and not h.idle.done():
+				h.idle.set_result(None)
+
+
+class Server(object):
+	'''
+	Serve the directory root via SFTP, see the top of this file
+	'''
+	threads		= 16		# thread pool size
+	queue		= 256		# requests in progress per session
+	maxread		= 256 * 1024	# maximum READ length (the client gets less)
+	readdir		= 100		# NAME entries per READDIR
+	sendfile	= 65536		# READs at least this large on sockets use os.sendfile(), 0 disables
+	mmap		= False		# READs of a readonly server from mmap(), see _mmap()
+	limits		= {		# concurrent requests per type, by RX flags read/write
+		(True, False):	64,
+		(False, True):	32,
+		(True, True):	32,
+		(False, False):	64,
+		}
+
+	def __init__(self, root, readonly=False, limits=None, threads=None, pool=None):
+		'''
+		limits can give the concurrency per RX type by name, like { 'READ': 8 }
+		'''
+		self.root	= os.path.realpath(root)
+		self.readonly	= readonly
+		self.pool	= pool or concurrent.futures.ThreadPoolExecutor(threads or self.threads, 'sftp')
+		self._limits	= {}
+		self._modifies	= [False] * 256
+		self._ops	= [None] * 256
+		for nr, r in RX._keep.items():
+			n	= (limits or {}).get(r['name'], self.limits[r['read'], r['write']])
+			self._limits[nr]	= n
+			self._modifies[nr]	= r['write']
+			self._ops[nr]	= getattr(self, '_' + r['name'].lower(), None)
+
+	async def serve(self, reader, writer):
+		await Session(self, reader, writer).main()
+
+	async def listen(self, where, **kw):
+		'''
+		Serve a unix socket path or ( host, port )
+		'''
+		if isinstance(where, str):
+			return await asyncio.start_unix_server(self.serve, where, **kw)
+		return await asyncio.start_server(self.serve, where[0], where[1], **kw)
+
+	async def stdio(self):
+		'''
+		Serve stdin/stdout, like sftp-server
+		'''
+		if stat.S_ISSOCK(os.fstat(0).st_mode):		# sftp -D passes a socketpair
+			reader, writer	= await asyncio.open_connection(sock=socket.socket(fileno=os.dup(0)))
+			return await self.serve(reader, writer)
+		loop	= asyncio.get_event_loop()
+		reader	= asyncio.StreamReader()
+		await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(0, 'rb', 0))
+		t, p	= await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(1, 'wb', 0))
+		writer	= asyncio.StreamWriter(t, p, reader, loop)
+		await self.serve(reader, writer)
+
+	# paths
+
+	def at(self, p, follow=True):
+		'''
+		( fd of the parent directory, last name, client path ) of client path p.
+		The path is walked from root with O_NOFOLLOW, symlinks are resolved
+		here, so neither ".." nor symlinks (even when swapped meanwhile) lead
+		outside.  With follow=False the last component is not resolved.
+		Use the name with dir_fd= and without following symlinks.
+		The caller must close the fd.
+		'''
+		todo	= collections.deque(c for c in p.split('/') if c and c != '.')
+		fds	= [os.open(self.root, _PATH | os.O_DIRECTORY)]
+		names	= []
+		links	= 0
+		try:
+			while todo:
+				c	= todo.popleft()
+				if c == '.':
+					continue
+				if c == '..':
+					if names:
+						names.pop()
+						os.close(fds.pop())
+					continue		# like "/..", the client cannot see above
+				if not todo and not follow:
+					todo.append(c)
+					break
+				try:
+					fd	= os.open(c, _PATH | os.O_NOFOLLOW, dir_fd=fds[-1])
+				except FileNotFoundError:
+					if todo:
+						raise
+					todo.appendleft(c)	# the last may be created
+					break
+				try:
+					st	= os.fstat(fd)
+					if stat.S_ISLNK(st.st_mode):
+						links	+= 1
+						if links > 40:
+							raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), p)
+						t	= os.readlink(c, dir_fd=fds[-1])
+						if t.startswith('/'):		# absolute links only work within root
+							if not (t + '/').startswith(self.root + '/'):
+								raise Fail(RET.PERMISSION_DENIED, 'outside of served tree')
+							while names:
+								names.pop()
+								os.close(fds.pop())
+							t	= t[len(self.root):]
+						todo.extendleft(reversed([x for x in t.split('/') if x]))
+						continue
+					if not todo:
+						todo.append(c)
+						break
+					if not stat.S_ISDIR(st.st_mode):
+						raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), p)
+					fds.append(fd)
+					names.append(c)
+					fd	= None
+				finally:
+					if fd is not None:
+						os.close(fd)
+			last	= todo.popleft() if todo else '.'
+			d	= fds.pop()
+			return d, last, '/' + '/'.join(names + ([last] if last != '.' else []))
+		finally:
+			for fd in fds:
+				os.close(fd)
+
+	def do(self, p, fn, follow=True):
+		'''
+		fn(parent fd, name) of client path p, see at()
+		'''
+		d, n, _	= self.at(p, follow)
+		try:
+			return fn(d, n)
+		finally:
+			os.close(d)
+
+	# requests, called as fn(session, packet)
+
+	async def _open(self, s, p):
+		f	= p.pflags
+		fl	= os.O_RDWR if f & MO.READ and f & MO.WRITE else os.O_WRONLY if f & MO.WRITE else os.O_RDONLY
+		for m, o in _FLAGS:
+			if f & m:
+				fl	|= o
+		perm	= p.attrs.perm & 0o7777 if p.attrs and p.attrs.perm is not None else 0o666
+		def op(d, n):
+			fd	= os.open(n, fl | os.O_NOFOLLOW | _CLOEXEC, perm, dir_fd=d)
+			if stat.S_ISDIR(os.fstat(fd).st_mode):
+				os.close(fd)
+				raise Fail(RET.FAILURE, 'is a directory')
+			return fd, p.path
+		fd, l	= await s.run(self.do, p.path, op)
+		await s.reply(TX.HANDLE, p.id, s.add(Handle(fd, l, ro=not f & _MODIFY, rd=bool(f & MO.READ))))
+
+	async def _opendir(self, s, p):
+		def op(d, n):
+			fd	= os.open(n, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | _CLOEXEC, dir_fd=d)
+			try:
+				return fd, os.scandir(fd)	# does not close fd
+			except BaseException:
+				os.close(fd)
+				raise
+		fd, it	= await s.run(self.do, p.path, op)
+		await s.reply(TX.HANDLE, p.id, s.add(Handle(fd, p.path, it)))
+
+	async def _close(self, s, p):
+		h	= s.handles.get(p.handle)
+		if h is None:
+			raise Fail(RET.FAILURE, 'invalid handle')
+		while h.flusher is not None or h.busy:
+			if h.flusher is not None:
+				await asyncio.wait([h.flusher])
+			else:
+				h.idle	= s.loop.create_future()
+				await h.idle
+		s.handles.pop(p.handle, None)
+		h.close()
+		await s.status(p.id, RET.OK)
+
+	async def _read(self, s, p):
+		h	= s.handle(p)
+		n	= min(p.len, self.maxread)
+		if h.mm is None:
+			h.mm	= self.mmap and self.readonly and h.ro and await s.using(h, s.run(self._mmap, h))
+		if s.lock is not None and n >= self.sendfile and h.rd:
+			size	= (await s.using(h, s.run(os.fstat, h.fd))).st_size
+			n	= min(n, size - p.offset)
+			if n <= 0:
+				raise Fail(RET.EOF)
+			if h.fo is None:
+				h.fo	= open(h.fd, 'rb', buffering=0, closefd=False)
+			head	= codec._U32.pack(9 + n) + bytes((TX.DATA,)) + codec._U32.pack(p.id) + codec._U32.pack(n)
+			await s.using(h, self._sendfile(s, h, head, p.offset, n))
+			return
+		if h.mm and p.offset < len(h.mm):
+			d	= memoryview(h.mm)[p.offset:p.offset + n]
+		else:
+			d	= await s.using(h, s.run(os.pread, h.fd, n, p.offset))
+		if not d:
+			raise Fail(RET.EOF)
+		await s.reply(TX.DATA, p.id, d)
+
+	async def _sendfile(self, s, h, head, offset, n):
+		'''
+		Send the DATA packet head and n bytes at offset.  After the
+		head the packet must have n bytes, so the rest is read with
+		os.pread() if sendfile fails, and padded if the file shrunk.
+		'''
+		async with s.lock:
+			s.writer.write(head)
+			h.fo.seek(offset)
+			try:
+				sent	= await s.loop.sendfile(s.writer.transport, h.fo, offset, n)
+			except ConnectionError:
+				raise
+			except OSError as e:
+				sent	= h.fo.tell() - offset		# the position follows what was sent
+				log.warn('sftp: sendfile failed', h.path, e)
+				try:
+					d	= await s.run(os.pread, h.fd, n - sent, offset + sent)
+				except OSError:
+					d	= b''
+				s.writer.write(d)
+				sent	+= len(d)
+			if sent != n:		# file shrunk meanwhile, keep the framing
+				s.writer.write(bytes(n - sent))
+
+	def _mmap(self, h):
+		'''
+		Map regular files opened read only, False if not possible.
+		Only with readonly and mmap set, and only if nothing else
+		modifies the files: truncating a mapped file kills the process with SIGBUS.
+		'''
+		try:
+			st	= os.fstat(h.fd)
+			if stat.S_ISREG(st.st_mode) and st.st_size:
+				return mmap.mmap(h.fd, 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError):
+			pass
+		return False
+
+	async def _write(self, s, p):
+		'''
+		Queue the WRITE for _flush() and wait until it is written:
+		so the WRITE limit bounds the data in memory, and when the
+		disk is slower than the client the session stops reading.
+		'''
+		h	= s.handle(p)
+		done	= s.loop.create_future()
+		h.writes.append((p.offset, p.data, p.id, done))
+		if h.flusher is None:
+			h.flusher	= asyncio.ensure_future(self._flush(s, h))
+		await done
+
+	async def _flush(self, s, h):
+		'''
+		Write runs of consecutive WRITEs with one os.pwritev() each
+		'''
+		w	= []
+		try:
+			while h.writes:
+				await asyncio.sleep(0)		# collect what arrived with the same read
+				w, h.writes	= h.writes, []
+				runs	= []
+				for o, d, id, done in w:
+					if runs and runs[-1][0] + runs[-1][1] == o and len(runs[-1][2]) < 64:
+						runs[-1][1]	+= len(d)
+						runs[-1][2].append(d)
+						runs[-1][3].append((id, done))
+					else:
+						runs.append([o, len(d), [d], [(id, done)]])
+				for o, n, bufs, ids in runs:
+					try:
+						await s.run(_pwritev, h.fd, bufs, o)
+						code, msg	= RET.OK, None
+					except Exception as e:
+						code, msg	= _status(e)
+					for id, done in ids:
+						await s.status(id, code, msg)
+						if not done.done():
+							done.set_result(None)
+		finally:
+			h.flusher	= None
+			for x in w + h.writes:		# when cancelled
+				if not x[3].done():
+					x[3].cancel()
+
+	async def _stat(self, s, p, follow=True):
+		st	= await s.run(self.do, p.path, lambda d, n: os.stat(n, dir_fd=d, follow_symlinks=False), follow)
+		await s.reply(TX.ATTRS, p.id, codec.Attrs.fromstat(st))
+
+	def _lstat(self, s, p):
+		return self._stat(s, p, False)
+
+	async def _fstat(self, s, p):
+		h	= s.handle(p)
+		st	= await s.using(h, s.run(os.fstat, h.fd))
+		await s.reply(TX.ATTRS, p.id, codec.Attrs.fromstat(st))
+
+	def _attrs(self, fd, a):
+		if a.size is not None:
+			os.ftruncate(fd, a.size)
+		if a.perm is not None:
+			os.fchmod(fd, a.perm & 0o7777)
+		if a.uid is not None:
+			os.fchown(fd, a.uid, a.gid)
+		if a.atime is not None:
+			os.utime(fd, (a.atime, a.mtime))
+
+	async def _setstat(self, s, p):
+		def op(d, n):
+			fd	= os.open(n, (os.O_WRONLY if p.attrs.size is not None else os.O_RDONLY) | os.O_NOFOLLOW | os.O_NONBLOCK | _CLOEXEC, dir_fd=d)
+			try:
+				self._attrs(fd, p.attrs)
+			finally:
+				os.close(fd)
+		await s.run(self.do, p.path, op)
+		await s.status(p.id, RET.OK)
+
+	async def _fsetstat(self, s, p):
+		h	= s.handle(p)
+		await s.using(h, s.run(self._attrs, h.fd, p.attrs))
+		await s.status(p.id, RET.OK)
+
+	async def _readdir(self, s, p):
+		h	= s.handle(p, True)
+		def op():
+			names	= []
+			for e in h.dir:
+				try:
+					st	= e.stat(follow_symlinks=False)
+				except OSError:
+					continue
+				names.append(codec.Name(e.name, longname(e.name, st), codec.Attrs.fromstat(st)))
+				if len(names) >= self.readdir:
+					break
+			return names
+		names	= await s.using(h, s.run(op))
+		if not names:
+			raise Fail(RET.EOF)
+		await s.reply(TX.NAME, p.id, names)
+
+	async def _simple(self, s, p, fn, *args):
+		await s.run(fn, *args)
+		await s.status(p.id, RET.OK)
+
+	def _remove(self, s, p):
+		return self._simple(s, p, self.do, p.path, lambda d, n: os.unlink(n, dir_fd=d), False)
+
+	def _rmdir(self, s, p):
+		return self._simple(s, p, self.do, p.path, lambda d, n: os.rmdir(n, dir_fd=d), False)
+
+	def _mkdir(self, s, p):
+		perm	= p.attrs.perm & 0o7777 if p.attrs and p.attrs.perm is not None else 0o777
+		return self._simple(s, p, self.do, p.path, lambda d, n: os.mkdir(n, perm, dir_fd=d), False)
+
+	def _rename(self, s, p):
+		def op(d, n):
+			def to(e, m):
+				try:
+					os.stat(m, dir_fd=e, follow_symlinks=False)
+				except FileNotFoundError:
+					return os.rename(n, m, src_dir_fd=d, dst_dir_fd=e)
+				raise Fail(RET.FAILURE, 'target exists')	# SFTP v3 rename does not overwrite
+			return self.do(p.new, to, False)
+		return self._simple(s, p, self.do, p.old, op, False)
+
+	def _symlink(self, s, p):
+		# the target is stored as is, see at() for how it resolves
+		return self._simple(s, p, self.do, p.link, lambda d, n: os.symlink(p.target, n, dir_fd=d), False)
+
+	async def _readlink(self, s, p):
+		t	= await s.run(self.do, p.path, lambda d, n: os.readlink(n, dir_fd=d), False)
+		await s.reply(TX.NAME, p.id, [codec.Name(t, t, codec.NOATTRS)])
+
+	def _virtual(self, p):
+		d, n, v	= self.at(p)
+		os.close(d)
+		return v
+
+	async def _realpath(self, s, p):
+		v	= await s.run(self._virtual, p.path)
+		await s.reply(TX.NAME, p.id, [codec.Name(v, v, codec.NOATTRS)])
+
+
+def _pwritev(fd, bufs, offset):
+	'''
+	os.pwritev() until all is written
+	'''
+	while bufs:
+		n	= os.pwritev(fd, bufs, offset)
+		offset	+= n
+		while bufs and n >= len(bufs[0]):
+			n	-= len(bufs[0])
+			bufs	= bufs[1:]
+		if bufs and n:
+			bufs	= [memoryview(bufs[0])[n:]] + bufs[1:]
+
+
+def main(args):
+	import argparse
+	a	= argparse.ArgumentParser(description='Serve a directory via SFTP on stdin/stdout or a socket')
+	a.add_argument('-r', '--readonly', action='store_true', help='refuse all modifications')
+	a.add_argument('-j', '--threads', type=int, default=None, help='size of the thread pool')
+	a.add_argument('dir', help='directory to serve')
+	a.add_argument('listen', nargs='?', help='host:port or socket path to listen on')
+	a	= a.parse_args(args)
+
+	s	= Server(a.dir, a.readonly, threads=a.threads)
+	async def run():
+		if not a.listen:
+			return await s.stdio()
+		host, _, port	= a.listen.rpartition(':')
+		srv	= await s.listen((host or None, int(port)) if port.isdigit() else a.listen)
+		async with srv:
+			await srv.serve_forever()
+	asyncio.get_event_loop().run_until_complete(run())
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
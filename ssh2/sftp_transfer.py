@@ -0,0 +1,267 @@
+# Parallel resumable SFTP transfers of large files
+#
+# vim:set ts=8:
+#
+# This Works is placed under the terms of the Copyright Less License,
+# see file COPYRIGHT.CLL.  USE AT OWN RISK, ABSOLUTELY NO WARRANTY.
+#
+# Usage:
+#	clients	= [ await Client.spawn('ssh', '-s', 'host', 'sftp') for _ in range(4) ]
+#	await download(clients, 'remote', 'local')	# or a single client
+#	await upload(clients, 'local', 'remote')
+#
+# The file is split into ranges of CHUNK bytes.  Each session works on
+# STREAMS ranges at once, each range is a pipelined stream of READs/WRITEs.
+# The destination is preallocated to the final size and ranges are written
+# where they belong, in whatever order they complete.
+#
+# Finished ranges are recorded in a JSON range map next to the local file
+# (local + '.ranges').  When interrupted, run the same call again and it
+# continues with the missing ranges, if the source did not change meanwhile
+# and the destination still is the preallocated one (see Ranges.dest),
+# else it starts over.
+# After all ranges are done, the size of the destination is verified
+# and the range map is removed.
+#
+# Downloads fdatasync() each range before it is recorded.  SFTP v3 has no
+# fsync, so after a crash of the server an upload might miss recorded data.
+
+from __future__ import absolute_import
+
+import os
+import json
+import errno
+import asyncio
+import collections
+
+import pytino.ssh2.sftp as sftp
+import pytino.ssh2.sftp_codec as codec
+import pytino.ssh2.sftp_client as client
+
+MO	= sftp.MO
+
+CHUNK	= 16 * 1024 * 1024	# bytes per range
+STREAMS	= 2			# ranges in progress per session
+
+
+class Changed(OSError):
+	'''
+	The source changed while transferring
+	'''
+
+
+class Ranges(object):
+	'''
+	Persisted map of finished ranges.
+	stamp identifies the source, a map of another stamp is not resumed.
+	dest identifies the preallocated destination, see verify().
+	'''
+	def __init__(self, path, size, stamp, chunk=CHUNK):
+		self.path	= path
+		self.size	= size
+		self.stamp	= stamp
+		self.chunk	= chunk
+		self.count	= (size + chunk - 1) // chunk
+		self.done	= set()
+		self.dest	= None
+		self.resumed	= False
+		try:
+			with open(path) as f:
+				m	= json.load(f)
+		except (OSError, ValueError):
+			return
+		if m.get('size') == size and m.get('stamp') == stamp and m.get('chunk') == chunk:
+			self.done	= set(i for i in m.get('done', ()) if 0 <= i < self.count)
+			self.dest	= m.get('dest')
+			self.resumed	= True
+
+	def verify(self, dest):
+		'''
+		Start over unless dest is the destination the map was recorded for
+		'''
+		if self.resumed and (dest is None or dest != self.dest):
+			self.done	= set()
+			self.resumed	= False
+
+	def range(self, i):
+		return i * self.chunk, min(self.size, (i + 1) * self.chunk)
+
+	def missing(self):
+		return [i for i in range(self.count) if i not in self.done]
+
+	def complete(self):
+		return len(self.done) == self.count
+
+	def bytes(self):
+		return sum(self.range(i)[1] - self.range(i)[0] for i in self.done)
+
+	def save(self):
+		tmp	= self.path + '.tmp'
+		with open(tmp, 'w') as f:
+			json.dump({'size': self.size, 'stamp': self.stamp, 'chunk': self.chunk, 'dest': self.dest, 'done': sorted(self.done)}, f)
+		os.replace(tmp, self.path)
+
+	def add(self, i):
+		self.done.add(i)
+		self.save()
+
+	def remove(self):
+		try:
+			os.unlink(self.path)
+		except FileNotFoundError:
+			pass
+
+
+def _stamp(a):
+	return '{}:{}'.format(a.size, a.mtime)
+
+
+def _local(st):
+	# the mtime changes with every write, the file must stay the same though
+	return '{}:{}:{}'.format(st.st_dev, st.st_ino, st.st_size)
+
+
+def _remote(a):
+	# SFTP v3 has nothing like an inode, and WRITEs change the mtime
+	return '{}'.format(a.size)
+
+
+def _preallocate(fd, size):
+	if os.fstat(fd).st_size > size:
+		os.ftruncate(fd, size)
+	try:
+		os.posix_fallocate(fd, 0, size)
+	except (AttributeError, OSError):
+		os.ftruncate(fd, size)		# not supported, sparse then
+
+
+def _clients(c):
+	return [c] if isinstance(c, client.Client) else list(c)
+
+
+async def _run(ranges, files, copy, streams, progress):
+	'''
+	Run copy(file, start, end) for all missing ranges,
+	streams at once per file, and record them
+	'''
+	todo	= collections.deque(ranges.missing())
+	got	= [ranges.bytes()]
+
+	async def worker(f):
+		while todo:
+			i	= todo.popleft()
+			s, e	= ranges.range(i)
+			await copy(f, s, e)
+			ranges.add(i)
+			got[0]	+= e - s
+			if progress:
+				progress(got[0], ranges.size)
+
+	tasks	= [asyncio.ensure_future(worker(f)) for f in files for _ in range(streams)]
+	try:
+		await asyncio.gather(*tasks)
+	except BaseException:
+		for t in tasks:
+			t.cancel()
+		await asyncio.wait(tasks)
+		for t in tasks:
+			if not t.cancelled():
+				t.exception()	# retrieved
+		raise
+
+
+async def download(clients, remote, local, chunk=CHUNK, streams=STREAMS, block=client.BLOCK, state=None, progress=None):
+	'''
+	Copy remote to local over one or several sessions.
+	state is the path of the range map, progress(bytes, size) is called per range.
+	'''
+	clients	= _clients(clients)
+	a	= await clients[0].stat(remote)
+	ranges	= Ranges(state or local + '.ranges', a.size, _stamp(a), chunk)
+	loop	= asyncio.get_event_loop()
+	fd	= os.open(local, os.O_RDWR | os.O_CREAT, 0o666)
+	files	= []
+	try:
+		ranges.verify(_local(os.fstat(fd)))
+		if not ranges.resumed:
+			await loop.run_in_executor(None, _preallocate, fd, a.size)
+			ranges.dest	= _local(os.fstat(fd))
+			ranges.save()
+
+		async def copy(f, s, e):
+			async for o, d in f.blocks(s, e, block):
+				os.pwrite(fd, d, o)
+				s	= o + len(d)
+			if s != e:
+				raise Changed(errno.ESTALE, 'sftp: source got shorter', remote)
+			await loop.run_in_executor(None, os.fdatasync, fd)	# before it is recorded
+
+		for c in clients:
+			files.append(await c.open(remote, 'r', block=block))
+		await _run(ranges, files, copy, streams, progress)
+
+		b	= await files[0].stat()
+		if _stamp(b) != ranges.stamp:
+			ranges.remove()
+			raise Changed(errno.ESTALE, 'sftp: source changed while copying', remote)
+		if not ranges.complete() or os.fstat(fd).st_size != a.size:
+			raise OSError(errno.EIO, 'sftp: incomplete copy', local)
+		ranges.remove()
+	finally:
+		for f in files:
+			await f.close()
+		os.close(fd)
+
+
+async def upload(clients, local, remote, chunk=CHUNK, streams=STREAMS, block=client.BLOCK, state=None, progress=None):
+	'''
+	Copy local to remote over one or several sessions, see download()
+	'''
+	clients	= _clients(clients)
+	fd	= os.open(local, os.O_RDONLY)
+	files	= []
+	try:
+		a	= codec.Attrs.fromstat(os.fstat(fd))
+		ranges	= Ranges(state or local + '.ranges', a.size, _stamp(a), chunk)
+
+		def chunks(s, e):
+			while s < e:
+				d	= os.pread(fd, min(block, e - s), s)
+				if not d:
+					raise Changed(errno.ESTALE, 'sftp: source got shorter', local)
+				yield s, d
+				s	+= len(d)
+
+		async def copy(f, s, e):
+			await f._writes(chunks(s, e))
+
+		if ranges.resumed:
+			try:
+				b	= await clients[0].stat(remote)
+			except client.Error as e:
+				if e.errno != errno.ENOENT:
+					raise
+				b	= None
+			ranges.verify(b and _remote(b))
+
+		fresh	= not ranges.resumed
+		for c in clients:
+			f	= await c.open(remote, MO.WRITE | MO.CREAT | (MO.TRUNC if fresh else 0), block=block)
+			files.append(f)
+			if fresh:
+				await f.truncate(a.size)
+				ranges.dest	= _remote(await f.stat())
+				ranges.save()
+				fresh	= False
+		await _run(ranges, files, copy, streams, progress)
+
+		if _stamp(codec.Attrs.fromstat(os.fstat(fd))) != ranges.stamp:
+			ranges.remove()
+			raise Changed(errno.ESTALE, 'sftp: source changed while copying', local)
+		if not ranges.complete() or await files[0].size() != a.size:
+			raise OSError(errno.EIO, 'sftp: incomplete copy', remote)
+		ranges.remove()
+	finally:
+		for f in files:
+			await f.close()
+		os.close(fd)
@@ -4,7 +4,24 @@ from __future__ import absolute_import
 
 import time
 
-def UTCstamp():
-	t	= time.gmtime()
-	return "%04d%02d%02d-%02d%02d%02d" % ( t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+# Rendering a timestamp is expensive compared to asking for the time.
+# However most calls ask for the same second, so cache the last one.
+_last	= (None, None)
 
+def UTCstamp(t=None, sub=0):
+	'''
+	UTC timestamp like 20200628-123456 of now or of t (seconds since epoch).
+	sub: number of sub-second digits to append, like .123 for sub=3
+	'''
+	if t is None:
+		t	= time.time()
+	global _last
+	s	= int(t)
+	last	= _last
+	if last[0] != s:
+		t0	= time.gmtime(s)
+		last	= (s, "%04d%02d%02d-%02d%02d%02d" % ( t0.tm_year, t0.tm_mon, t0.tm_mday, t0.tm_hour, t0.tm_min, t0.tm_sec))
+		_last	= last	# a single assignment, so threads do not matter
+	if not sub:
+		return last[1]
+	return '%s.%0*d' % (last[1], sub, int((t - s) * 10**sub))